@@ -0,0 +1,80 @@
+from __future__ import print_function
+import tracemalloc
+from timeit import default_timer
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.regressor import Regressor
+
+"""
+Micro-benchmark of the latency of draw_action on a single state, as in an
+online controller. It mimics an FQI policy on the Bicycle balancing task
+(5-dimensional states, 9 discrete actions) and reports the median and the
+99th percentile of the latency of maxQA (the generic path), of the single
+state path of draw_action and of draw_action on the compiled policy. It
+also reports the memory allocated during a call (the peak traced by
+tracemalloc), which for the single state path is left to the estimator.
+"""
+
+n_samples = 20000
+n_calls = 1000
+state_dim, action_dim = 5, 1
+discrete_actions = np.arange(9)
+regressor_params = {'n_estimators': 50,
+                    'min_samples_split': 5,
+                    'min_samples_leaf': 2}
+
+np.random.seed(0)
+states = np.random.uniform(-1, 1, (n_samples, state_dim))
+actions = np.random.choice(discrete_actions, (n_samples, action_dim))
+next_states = np.random.uniform(-1, 1, (n_samples, state_dim))
+absorbing = np.zeros(n_samples)
+r = np.random.randn(n_samples)
+sast = np.column_stack((states, actions, next_states, absorbing))
+
+regressor = Regressor(ExtraTreesRegressor, **regressor_params)
+regressor = ActionRegressor(regressor, discrete_actions=discrete_actions,
+                            tol=.5)
+fqi = FQI(estimator=regressor,
+          state_dim=state_dim,
+          action_dim=action_dim,
+          discrete_actions=discrete_actions,
+          gamma=.98,
+          horizon=1,
+          tie_breaking='first')
+fqi.partial_fit(sast, r)
+compiled = fqi.compile()
+
+
+def latency(f):
+    times = np.empty(n_calls)
+    for i in range(n_calls):
+        state = next_states[i]
+        start = default_timer()
+        f(state)
+        times[i] = default_timer() - start
+
+    return np.percentile(times, 50) * 1e3, np.percentile(times, 99) * 1e3
+
+
+def allocated(f):
+    # the first call allocates the buffers of the single state path
+    f(next_states[0])
+    tracemalloc.start()
+    f(next_states[1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak / 1e3
+
+
+for name, f in [
+        ('maxQA', lambda s: fqi.maxQA(s.reshape(1, -1), False, True)),
+        ('draw_action', lambda s: fqi.draw_action(s, False, True)),
+        ('compiled', lambda s: compiled.draw_action(s, False, True))]:
+    p50, p99 = latency(f)
+    print('{:12s} p50 {:7.3f} ms  p99 {:7.3f} ms  allocated {:8.1f} kB'.format(
+        name, p50, p99, allocated(f)))
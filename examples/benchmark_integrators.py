@@ -0,0 +1,54 @@
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from ifqi.envs import Acrobot, CarOnHill
+
+"""
+Benchmark of the integrators of the Acrobot and CarOnHill dynamics. It
+measures the transitions per second simulated by odeint and by the
+fixed-step rk4 integrator, stepping a single environment and a vectorized
+environment with a batch of episodes. On a single environment odeint is
+faster: rk4 only pays off when a batch of episodes is integrated at once.
+Acrobot episodes are restarted every few steps: under random actions its
+velocities reach thousands of radians per second after a few tens of
+transitions, where both integrators need very small steps, and the batch
+is integrated with the steps of its fastest episode.
+"""
+
+n_steps = 500
+n_envs = 289
+
+
+def run(env, actions, episode_length, vectorized):
+    np.random.seed(0)
+    if vectorized:
+        env = env.vectorize(n_envs)
+        batch = np.random.choice(actions, (n_steps, n_envs, 1))
+    else:
+        batch = np.random.choice(actions, (n_steps, 1))
+
+    start = time.time()
+    env.reset()
+    for t in range(n_steps):
+        env.step(batch[t])
+        if (t + 1) % episode_length == 0 or \
+                (not vectorized and env._absorbing):
+            env.reset()
+    elapsed = time.time() - start
+
+    return batch[:, 0].size * (n_envs if vectorized else 1) / elapsed
+
+
+for cls, actions, episode_length in [(CarOnHill, [-4., 4.], 100),
+                                    (Acrobot, [-5., 5.], 10)]:
+    for vectorized in [False, True]:
+        rates = dict()
+        for integrator in ['odeint', 'rk4']:
+            env = cls(integrator=integrator, n_substeps=10)
+            rates[integrator] = run(env, actions, episode_length,
+                                    vectorized)
+        print('%s%s: odeint %.0f steps/s, rk4 %.0f steps/s (speedup %.1fx)' %
+              (cls.__name__, ' (%d envs)' % n_envs if vectorized else '',
+               rates['odeint'], rates['rk4'], rates['rk4'] / rates['odeint']))
@@ -0,0 +1,74 @@
+from __future__ import print_function
+import time
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.regressor import Regressor
+
+"""
+Benchmark of the parallel evaluation of the Q-function of every action.
+It mimics an FQI iteration on the Bicycle balancing task (5-dimensional
+states, 9 discrete actions) and measures the time spent by maxQA when the
+action models are evaluated sequentially or concurrently.
+On a single core the parallel evaluation is not faster, since the trees are
+evaluated by pure computation and the workers only add their overhead:
+sequential 10.5s, actions with threads 1.02x, actions with processes 0.75x,
+chunks with threads 0.54x, chunks with processes 0.69x. Run it on a machine
+with several cores to measure the speedup.
+"""
+
+n_samples = 100000
+n_jobs = -1
+state_dim, action_dim = 5, 1
+discrete_actions = np.arange(9)
+regressor_params = {'n_estimators': 50,
+                    'min_samples_split': 5,
+                    'min_samples_leaf': 2}
+
+np.random.seed(0)
+states = np.random.uniform(-1, 1, (n_samples, state_dim))
+actions = np.random.choice(discrete_actions, (n_samples, action_dim))
+next_states = np.random.uniform(-1, 1, (n_samples, state_dim))
+absorbing = np.zeros(n_samples)
+r = np.random.randn(n_samples)
+sast = np.column_stack((states, actions, next_states, absorbing))
+
+regressor = Regressor(ExtraTreesRegressor, **regressor_params)
+regressor = ActionRegressor(regressor, discrete_actions=discrete_actions,
+                            tol=.5)
+fqi = FQI(estimator=regressor,
+          state_dim=state_dim,
+          action_dim=action_dim,
+          discrete_actions=discrete_actions,
+          gamma=.98,
+          horizon=1)
+fqi.partial_fit(sast, r)
+
+
+def run(model_jobs, chunk_jobs, prefer='threads', repetitions=3):
+    regressor.n_jobs = model_jobs
+    regressor.prefer = prefer
+    fqi.n_jobs = chunk_jobs
+    fqi.prefer = prefer
+
+    times = list()
+    for _ in range(repetitions):
+        start = time.time()
+        q, a = fqi.maxQA(next_states, absorbing)
+        times.append(time.time() - start)
+
+    return np.min(times), q
+
+
+sequential, q = run(1, 1)
+print('sequential: %.3fs' % sequential)
+for name, model_jobs, chunk_jobs in [('actions', n_jobs, 1),
+                                     ('chunks', 1, n_jobs)]:
+    for prefer in ['threads', 'processes']:
+        elapsed, parallel_q = run(model_jobs, chunk_jobs, prefer)
+        assert np.allclose(q, parallel_q)
+        print('parallel %s (%s): %.3fs (speedup %.2fx)' % (
+            name, prefer, elapsed, sequential / elapsed))
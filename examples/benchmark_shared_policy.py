@@ -0,0 +1,73 @@
+from __future__ import print_function
+import pickle
+import time
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.envs import CarOnHill
+from ifqi.evaluation import SharedPolicy
+from ifqi.evaluation.evaluation import evaluate_policy
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.regressor import Regressor
+
+"""
+Benchmark of the serialization of an FQI policy in the parallel evaluation.
+It compares the cost of pickling the policy, as done by joblib for every
+job, with the cost of dumping it once to a memory-mapped file
+(SharedPolicy), and measures the parallel evaluation on Car-On-Hill when
+the file is written by evaluate_policy and when it is reused.
+"""
+
+n_samples = 100000
+n_jobs = -1
+n_episodes_per_job = 10
+state_dim, action_dim = 2, 1
+discrete_actions = np.array([-4., 4.])
+regressor_params = {'n_estimators': 50,
+                    'min_samples_split': 5,
+                    'min_samples_leaf': 2}
+
+np.random.seed(0)
+mdp = CarOnHill()
+states = np.column_stack((np.random.uniform(-1, 1, n_samples),
+                          np.random.uniform(-3, 3, n_samples)))
+actions = np.random.choice(discrete_actions, (n_samples, action_dim))
+next_states = states + np.random.randn(n_samples, state_dim) * .01
+absorbing = np.zeros(n_samples)
+r = np.random.randn(n_samples)
+sast = np.column_stack((states, actions, next_states, absorbing))
+
+regressor = Regressor(ExtraTreesRegressor, **regressor_params)
+regressor = ActionRegressor(regressor, discrete_actions=discrete_actions,
+                            tol=.5)
+fqi = FQI(estimator=regressor,
+          state_dim=state_dim,
+          action_dim=action_dim,
+          discrete_actions=discrete_actions,
+          gamma=mdp.gamma,
+          horizon=1)
+fqi.partial_fit(sast, r)
+
+start = time.time()
+pickled = pickle.dumps(fqi, protocol=pickle.HIGHEST_PROTOCOL)
+pickle_time = time.time() - start
+shared = SharedPolicy(fqi)
+print('pickle:        {:8.1f} MB {:7.3f} s per job'.format(
+    len(pickled) / 1e6, pickle_time))
+print('shared file:   {:8.1f} MB {:7.3f} s once'.format(
+    shared.nbytes / 1e6, shared.dump_time))
+print('shared handle: {:8.1f} kB per job'.format(
+    len(pickle.dumps(shared)) / 1e3))
+
+initial_states = mdp.initial_states
+for name, policy in [('dumped', fqi), ('reused', shared)]:
+    start = time.time()
+    values = evaluate_policy(mdp, policy, initial_states=initial_states,
+                             n_jobs=n_jobs,
+                             n_episodes_per_job=n_episodes_per_job)
+    print('{:7s} evaluation: {:.2f} s (J = {:.3f})'.format(
+        name, time.time() - start, values[0]))
+
+shared.close()
@@ -23,7 +23,7 @@ regressor_params = dict(features=dict(name='poly',
                                       params=dict(degree=5)))
 regressor = Regressor(Linear, **regressor_params)
 lspi = LSPI(regressor, state_dim, action_dim, mdp.action_space.values,
-            mdp.gamma)
+            mdp.gamma, cache_features=True)
 
 sast, r = split_data_for_fqi(dataset, state_dim, action_dim, reward_dim)
 
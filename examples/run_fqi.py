@@ -8,6 +8,7 @@ import numpy as np
 from ifqi import envs
 from ifqi.algorithms.fqi import FQI
 from ifqi.evaluation import evaluation
+from ifqi.evaluation.dataset import DatasetWriter, TransitionDataset
 from ifqi.evaluation.utils import split_data_for_fqi
 from ifqi.loadexperiment import get_MDP, get_model
 from ifqi.models.actionregressor import ActionRegressor
@@ -88,11 +89,23 @@ for e in range(config['experiment_setting']['evaluation']['n_experiments']):
     print('Experiment: %d' % (e + 1))
     experiment_results = list()
 
-    # Load dataset
-    dataset = evaluation.collect_episodes(
-        mdp, n_episodes=np.sort(config['experiment_setting']['evaluation']
-                                ['n_episodes'])[-1])
-    print('Dataset has %d samples' % dataset.shape[0])
+    # Load dataset. When a dataset path is provided, the dataset of each
+    # experiment is collected once and memory-mapped by the following runs
+    dataset_path = config['experiment_setting'].get('dataset_path')
+    if dataset_path is not None:
+        dataset_path = os.path.join(dataset_path, str(e))
+    if dataset_path is not None and os.path.exists(dataset_path):
+        dataset = TransitionDataset.load(dataset_path)
+    else:
+        dataset = evaluation.collect_episodes(
+            mdp, n_episodes=np.sort(config['experiment_setting']['evaluation']
+                                    ['n_episodes'])[-1])
+        if dataset_path is not None:
+            with DatasetWriter(dataset_path, state_dim, action_dim,
+                               reward_dim) as writer:
+                writer.append(dataset)
+            dataset = TransitionDataset.load(dataset_path)
+    print('Dataset has %d samples' % len(dataset))
 
     # Load FQI
     fqi = FQI(estimator=regressor,
@@ -101,15 +114,19 @@ for e in range(config['experiment_setting']['evaluation']['n_experiments']):
               discrete_actions=discrete_actions,
               gamma=config['fqi']['gamma'],
               horizon=config['fqi']['horizon'],
-              verbose=config['fqi']['verbose'])
+              verbose=config['fqi']['verbose'],
+              epsilon=config['fqi'].get('epsilon'))
     fit_params = config['fit_params']
 
     if config['experiment_setting']['evaluation']['metric'] == 'n_episodes':
+        # the episode offsets are computed (or loaded) once
+        if not isinstance(dataset, TransitionDataset):
+            dataset = TransitionDataset.from_array(
+                dataset, state_dim, action_dim, reward_dim, copy=False)
         for i in config['experiment_setting']['evaluation']['n_episodes']:
-            episode_end_idxs = np.argwhere(dataset[:, -1] == 1).ravel()
-            last_el = episode_end_idxs[i - 1]
+            # the prefixes are views of the dataset
             sast, r = split_data_for_fqi(dataset, state_dim, action_dim,
-                                         reward_dim, last_el + 1)
+                                         reward_dim, episodes=i)
 
             fqi.fit(sast, r, **fit_params)
 
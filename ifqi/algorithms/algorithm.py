@@ -1,8 +1,12 @@
 from __future__ import print_function
+import copy
+
 import numpy as np
-from numpy.matlib import repmat
+from joblib import Parallel, delayed, effective_n_jobs
 
+from ifqi.evaluation.dataset import TransitionDataset
 from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.compiled import compile_model
 from ifqi.models.ensemble import Ensemble
 
 """
@@ -10,9 +14,57 @@ Interface for algorithm.
 """
 
 
+def _state_action_grid(states, actions):
+    """
+    Build the matrix containing every (state, action) pair.
+    Args:
+        states (numpy.array): the states. Dimensions: (n_states x state_dim)
+        actions (numpy.array): the discrete actions.
+                               Dimensions: (n_actions x action_dim)
+    Returns:
+        The matrix whose row i * n_actions + j contains the i-th state
+        followed by the j-th action.
+        Dimensions: (n_states * n_actions x state_dim + action_dim)
+    """
+    n_states, state_dim = states.shape
+    n_actions, action_dim = actions.shape
+
+    grid = np.empty((n_states, n_actions, state_dim + action_dim),
+                    dtype=np.result_type(states, actions))
+    grid[:, :, :state_dim] = states[:, np.newaxis, :]
+    grid[:, :, state_dim:] = actions[np.newaxis, :, :]
+
+    return grid.reshape(n_states * n_actions, state_dim + action_dim)
+
+
+def _predict_q(estimator, states, actions, **kwargs):
+    """
+    Computes the Q-function of every discrete action in the provided states.
+    Args:
+        estimator (object): the model of the Q-function
+        states (numpy.array): the states. Dimensions: (n_states x state_dim)
+        actions (numpy.array): the discrete actions.
+                               Dimensions: (n_actions x action_dim)
+        **kwargs: additional parameters to be passed to the predict function
+                  of the estimator
+    Returns:
+        The matrix of Q-values. Dimensions: (n_states x n_actions)
+    """
+    if hasattr(estimator, 'predict_q'):
+        # compiled models evaluate every action at once
+        return estimator.predict_q(states, actions, **kwargs)
+
+    samples = _state_action_grid(states, actions)
+    predictions = estimator.predict(samples, **kwargs)
+
+    return predictions.reshape(states.shape[0], actions.shape[0])
+
+
 class Algorithm(object):
     def __init__(self, estimator, state_dim, action_dim,
-                 discrete_actions, gamma, horizon, verbose=0):
+                 discrete_actions, gamma, horizon, verbose=0,
+                 chunk_size=None, chunk_bytes=None, n_jobs=1,
+                 prefer='threads', tie_breaking='random'):
         """
         Constructor.
         Args:
@@ -23,8 +75,27 @@ class Algorithm(object):
             gamma (float): discount factor
             horizon (int): horizon
             verbose (int, False): verbosity level
+            chunk_size (int, None): maximum number of states evaluated at
+                                    once by maxQA. If None, all the states
+                                    are evaluated together
+            chunk_bytes (int, None): maximum size in bytes of the
+                                     state-action matrix built by maxQA
+                                     for each chunk of states
+            n_jobs (int, 1): number of jobs used by maxQA to evaluate the
+                             chunks of states concurrently
+            prefer (str, 'threads'): 'threads' for estimators releasing the
+                                     GIL (e.g. scikit-learn trees),
+                                     'processes' otherwise
+            tie_breaking (str, 'random'): how the action is chosen among the
+                                          ones with the same maximal
+                                          Q-value when a single state is
+                                          evaluated: 'random' or 'first'
+                                          (deterministic)
 
         """
+        if tie_breaking not in ['random', 'first']:
+            raise ValueError('unknown tie breaking {}.'.format(tie_breaking))
+
         self._estimator = estimator
         self.gamma = gamma
         self.horizon = horizon
@@ -40,16 +111,49 @@ class Algorithm(object):
                 self._actions = discrete_actions
             else:
                 assert action_dim == 1
-                self._actions = np.array(discrete_actions, dtype='float32').T
+                self._actions = np.array(
+                    discrete_actions, dtype='float32').reshape(-1, 1)
         else:
             self._actions = np.array(
                 discrete_actions, dtype='float32').reshape(-1, action_dim)
             assert len(self._actions) > 1, \
                 'Error: at least two actions are required'
 
+        self.chunk_size = chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.n_jobs = n_jobs
+        self.prefer = prefer
+        self.tie_breaking = tie_breaking
+
+        # state-action matrix of the single state evaluations
+        self._single_sa = None
+
+        self._snext = None
+        self.reset_q_cache()
+
         self._iteration = 0
         self._verbose = verbose
 
+    def _set_dataset(self, sast):
+        """
+        Store the dataset used by the algorithm.
+        Args:
+            sast (numpy.array, TransitionDataset): the input in the dataset.
+                When a TransitionDataset is provided, its rewards are
+                stored as well
+        """
+        if isinstance(sast, TransitionDataset):
+            self._sa = sast.sa
+            self._snext = sast.next_state
+            self._absorbing = sast.absorbing
+            self._r = sast.reward
+        else:
+            next_states_idx = self.state_dim + self.action_dim
+            self._sa = sast[:, :next_states_idx]
+            self._snext = sast[:, next_states_idx:-1]
+            self._absorbing = sast[:, -1]
+        self.reset_q_cache()
+
     def _check_states(self, X):
         """
         Check the correctness of the matrix containing the dataset.
@@ -63,7 +167,12 @@ class Algorithm(object):
     def maxQA(self, states, absorbing, evaluation=False):
         """
         Computes the maximum Q-function and the associated action
-        in the provided states.
+        in the provided states. States are evaluated in chunks (see
+        chunk_size and chunk_bytes) so that only the state-action matrix
+        of the current chunk is kept in memory; chunks are evaluated
+        concurrently when n_jobs is not 1. When the estimator is an
+        ensemble, the Q-values of the next states of the dataset are
+        updated incrementally at each new stage (see _cached_q).
         Args:
             states (numpy.array): states to be evaluated.
                                   Dimenions: (nsamples x state_dim)
@@ -75,40 +184,128 @@ class Algorithm(object):
         """
         new_state = self._check_states(states)
         n_states = new_state.shape[0]
-        n_actions = self._actions.shape[0]
+        not_absorbing = 1 - np.broadcast_to(
+            np.asarray(absorbing, dtype=float).ravel(), (n_states,))
 
-        Q = np.zeros((n_states, n_actions))
-        for action_idx in range(n_actions):
-            actions = np.matlib.repmat(self._actions[action_idx], n_states, 1)
+        if not evaluation and states is self._snext and \
+                self._has_ensembles():
+            Qs = [(slice(0, n_states), self._cached_q(new_state))]
+        else:
+            Qs = self._predict_q_chunks(new_state)
 
-            # concatenate [new_state, action] and scalarize them
-            samples = np.column_stack((new_state, actions))
+        rQ = np.empty(n_states)
+        amax = np.empty(n_states, dtype=int)
+        for chunk, Q in Qs:
+            Q = Q * not_absorbing[chunk, np.newaxis]
 
-            # predict Q-function
-            if not evaluation \
-               and isinstance(self._estimator, ActionRegressor) \
-               and self._estimator.has_ensembles():
-                opt_pars = {'n_actions': n_actions, 'action_idx': action_idx}
+            # compute the maximal action
+            if n_states > 1:
+                amax[chunk] = np.argmax(Q, axis=1)
             else:
-                opt_pars = dict()
-            predictions = self._estimator.predict(samples, **opt_pars)
+                amax[chunk] = self._argmax(Q[0])
+            rQ[chunk] = Q[np.arange(Q.shape[0]), amax[chunk]]
 
-            Q[:, action_idx] = predictions * (1 - absorbing)
+        # store Q-value and action for each state
+        rA = self._actions[amax].astype(float)
+
+        return rQ, rA
 
-        # compute the maximal action
-        if Q.shape[0] > 1:
-            amax = np.argmax(Q, axis=1)
+    def _predict_q_chunks(self, states, **kwargs):
+        """
+        Computes the Q-function of every discrete action in the provided
+        states, one chunk of states at a time. When n_jobs is not 1, groups
+        of n_jobs chunks are evaluated concurrently.
+        Args:
+            states (numpy.array): states to be evaluated.
+                                  Dimensions: (nsamples x state_dim)
+            **kwargs: additional parameters to be passed to the predict
+                      function of the estimator
+        Returns:
+            a generator of (chunk, Q) pairs, where chunk is the slice of the
+            evaluated states and Q the matrix of their Q-values
+        """
+        chunks = list(self._chunks(states))
+        if self.n_jobs == 1 or len(chunks) == 1:
+            for chunk in chunks:
+                yield chunk, _predict_q(self._estimator, states[chunk],
+                                        self._actions, **kwargs)
         else:
-            q = Q[0]
-            amax = np.array([np.random.choice(np.argwhere(q == np.max(q)).ravel())]).ravel()
+            n_jobs = effective_n_jobs(self.n_jobs)
+            with Parallel(n_jobs=self.n_jobs, prefer=self.prefer) as parallel:
+                for start in range(0, len(chunks), n_jobs):
+                    batch = chunks[start:start + n_jobs]
+                    Qs = parallel(
+                        delayed(_predict_q)(self._estimator, states[chunk],
+                                            self._actions, **kwargs)
+                        for chunk in batch)
+                    for chunk, Q in zip(batch, Qs):
+                        yield chunk, Q
 
-        # store Q-value and action for each state
-        rQ, rA = np.zeros(n_states), np.zeros((n_states, self.action_dim))
-        for idx in range(n_states):
-            rQ[idx] = Q[idx, amax[idx]]
-            rA[idx] = self._actions[amax[idx]]
+    def _chunks(self, states):
+        """
+        Split the provided states in chunks according to chunk_size and
+        chunk_bytes.
+        Args:
+            states (numpy.array): states to be evaluated.
+                                  Dimensions: (nsamples x state_dim)
+        Returns:
+            a generator of slices covering all the states
+        """
+        n_states = states.shape[0]
+        step = n_states
+        if self.n_jobs != 1:
+            n_jobs = effective_n_jobs(self.n_jobs)
+            step = (n_states + n_jobs - 1) // n_jobs
+        if self.chunk_size is not None:
+            step = min(step, self.chunk_size)
+        if self.chunk_bytes is not None:
+            row_bytes = self._actions.shape[0] * \
+                (self.state_dim + self.action_dim) * \
+                np.result_type(states, self._actions).itemsize
+            step = min(step, self.chunk_bytes // row_bytes)
+        step = max(step, 1)
 
-        return rQ, rA
+        for start in range(0, n_states, step):
+            yield slice(start, min(start + step, n_states))
+
+    def _has_ensembles(self):
+        if isinstance(self._estimator, ActionRegressor):
+            return self._estimator.has_ensembles()
+        return isinstance(self._estimator, Ensemble)
+
+    def _cached_q(self, states):
+        """
+        Computes the Q-function of every discrete action in the next states
+        of the dataset. The Q-values of an ensemble are the sum of the
+        predictions of its stages, hence they are stored and only the
+        stages added since the previous call are evaluated. Each stage is
+        assumed to be fitted only once.
+        Args:
+            states (numpy.array): the next states of the dataset.
+                                  Dimensions: (nsamples x state_dim)
+        Returns:
+            the matrix of Q-values. Dimensions: (nsamples x n_actions)
+        """
+        n_states = states.shape[0]
+        if self._q_cache is None or self._q_cache.shape[0] != n_states:
+            self._q_cache = np.zeros((n_states, self._actions.shape[0]))
+            self._q_cache_stages = 0
+
+        n_stages = self._estimator.n_stages
+        for stage in range(self._q_cache_stages, n_stages):
+            for chunk, Q in self._predict_q_chunks(states, stage=stage):
+                self._q_cache[chunk] += Q
+        self._q_cache_stages = n_stages
+
+        return self._q_cache
+
+    def reset_q_cache(self):
+        """
+        Forget the Q-values stored for the next states of the dataset. It
+        must be called when the dataset changes.
+        """
+        self._q_cache = None
+        self._q_cache_stages = 0
 
     def draw_action(self, states, absorbing, evaluation=False):
         """
@@ -127,10 +324,90 @@ class Algorithm(object):
             raise ValueError(
                 'The model must be trained before being evaluated')
 
+        if np.size(states) == self.state_dim:
+            return self._draw_single_action(states, absorbing)
+
         _, maxa = self.maxQA(states, absorbing, evaluation)
 
         return maxa
 
+    def _draw_single_action(self, state, absorbing):
+        """
+        Compute the action with the highest Q value in a single state (e.g.
+        in a control loop). The state-action matrix and the actions are
+        allocated at the first call and only the state columns of the matrix
+        are updated afterwards, hence the only allocations left are the ones
+        of the estimator.
+        Args:
+            state (numpy.array): the state. Dimensions: (state_dim)
+            absorbing (bool): true if the state is absorbing
+        Returns:
+            the action, a read-only view of the discrete actions: copy it
+            before modifying it. Dimensions: (1 x action_dim)
+        """
+        if self._single_sa is None or not self._single_sa.flags.writeable:
+            self._single_sa = _state_action_grid(
+                np.zeros((1, self.state_dim)), self._actions)
+            self._single_actions = self._actions.astype(float)
+            self._single_actions.flags.writeable = False
+        sa = self._single_sa
+        sa[:, :self.state_dim] = np.ravel(state)
+
+        if hasattr(self._estimator, 'predict_q'):
+            q = self._estimator.predict_q(sa[:1, :self.state_dim],
+                                          self._actions)[0]
+        else:
+            # the action columns never change, hence an ActionRegressor
+            # reuses the partition of the matrix
+            q = self._estimator.predict(sa)
+        if absorbing:
+            # all the actions have zero value
+            q[:] = 0.
+
+        a = self._argmax(q)
+
+        return self._single_actions[a:a + 1]
+
+    def _argmax(self, q):
+        """
+        Returns:
+            the index of the maximum of q, ties are broken according to
+            tie_breaking
+        """
+        if self.tie_breaking == 'first':
+            return np.argmax(q)
+        return np.random.choice(np.argwhere(q == np.max(q)).ravel())
+
+    def compile(self):
+        """
+        Build a copy of the algorithm whose Q-function is computed by the
+        compiled trees of the estimator (see ifqi.models.compiled), for a
+        faster action selection in few states at a time (e.g. in a control
+        loop); large batches of states are evaluated faster by the
+        scikit-learn trees. The copy can draw actions and be evaluated, but
+        it cannot be trained.
+        Returns:
+            the compiled copy of the algorithm
+        """
+        if self._iteration == 0:
+            raise ValueError(
+                'The model must be trained before being compiled')
+
+        compiled = copy.copy(self)
+        compiled._estimator = compile_model(self._estimator)
+        compiled._single_sa = None
+        compiled.reset_q_cache()
+
+        return compiled
+
+    def __getstate__(self):
+        # the state-action matrix of the single state evaluations is written
+        # in place, hence the copies loaded in other processes (e.g.
+        # memory-mapped read-only by SharedPolicy) allocate their own
+        state = self.__dict__.copy()
+        state['_single_sa'] = None
+        return state
+
     def reset(self):
         """
         Reset.
@@ -141,3 +418,4 @@ class Algorithm(object):
         self._snext = None
         self._absorbing = None
         self._verbose = False
+        self.reset_q_cache()
@@ -1,4 +1,5 @@
 from __future__ import print_function
+import numpy as np
 
 from ifqi.algorithms.algorithm import Algorithm
 
@@ -17,11 +18,37 @@ class FQI(Algorithm):
     """
 
     def __init__(self, estimator, state_dim, action_dim,
-                 discrete_actions, gamma, horizon, verbose=False):
+                 discrete_actions, gamma, horizon, verbose=False,
+                 chunk_size=None, chunk_bytes=None, n_jobs=1,
+                 prefer='threads', warm_start=False, epsilon=None,
+                 norm_value=np.inf, tie_breaking='random'):
+        """
+        Constructor.
+        Args:
+            warm_start (bool, False): if true, from the second iteration on
+                the estimator is trained starting from the solution of the
+                previous iteration, when it supports it (see
+                set_warm_start of the models)
+            epsilon (float, None): fit stops before the horizon when the
+                norm of the change of the targets between two successive
+                iterations is lower than epsilon. If None, the change is
+                only recorded in deltas
+            norm_value (np.inf, int): the norm used to measure the change
+                of the targets
+
+        See Algorithm for the other parameters.
+        """
         self.__name__ = 'FQI'
+        self._warm_start = warm_start
+        self._epsilon = epsilon
+        self._norm_value = norm_value
+        self._y = None
+        self.deltas = list()
+        self.converged = False
         super(FQI, self).__init__(estimator, state_dim, action_dim,
                                   discrete_actions, gamma, horizon,
-                                  verbose)
+                                  verbose, chunk_size, chunk_bytes,
+                                  n_jobs, prefer, tie_breaking)
 
     def partial_fit(self, sast=None, r=None, **kwargs):
         """
@@ -30,8 +57,10 @@ class FQI(Algorithm):
         provide None inputs after the first iteration.
 
         Args:
-            sast (numpy.array, None): the input in the dataset
-            r (numpy.array, None): the output in the dataset
+            sast (numpy.array, TransitionDataset, None): the input in the
+                dataset
+            r (numpy.array, None): the output in the dataset. It can be
+                omitted when sast is a TransitionDataset
             **kwargs: additional parameters to be provided to the fit function
             of the estimator
 
@@ -39,10 +68,9 @@ class FQI(Algorithm):
             sa, y: the preprocessed input and output
         """
         if sast is not None:
-            next_states_idx = self.state_dim + self.action_dim
-            self._sa = sast[:, :next_states_idx]
-            self._snext = sast[:, next_states_idx:-1]
-            self._absorbing = sast[:, -1]
+            self._set_dataset(sast)
+            # targets of different datasets cannot be compared
+            self._y = None
         if r is not None:
             self._r = r
 
@@ -63,19 +91,35 @@ class FQI(Algorithm):
 
             y = self._r + self.gamma * maxq
 
+        # monitor the convergence of the targets
+        if self._y is not None:
+            delta = np.linalg.norm(y.ravel() - self._y.ravel(),
+                                   self._norm_value)
+            self.deltas.append(delta)
+            self.converged = self._epsilon is not None and \
+                delta < self._epsilon
+            if self._verbose > 0:
+                print('delta: {}'.format(delta))
+        self._y = y
+
+        if self._warm_start and hasattr(self._estimator, 'set_warm_start'):
+            # the first iteration is trained from scratch
+            self._estimator.set_warm_start(self._iteration > 0)
         self._estimator.fit(self._sa, y.ravel(), **kwargs)
 
         self._iteration += 1
 
         return self._sa, y
 
-    def fit(self, sast, r, **kwargs):
+    def fit(self, sast, r=None, **kwargs):
         """
-        Perform steps of FQI using input data sast and r.
+        Perform steps of FQI using input data sast and r. The run stops
+        before the horizon when the targets converged (see epsilon).
 
         Args:
-            sast (numpy.array): the input in the dataset
-            r (numpy.array): the output in the dataset
+            sast (numpy.array, TransitionDataset): the input in the dataset
+            r (numpy.array, None): the output in the dataset. It can be
+                omitted when sast is a TransitionDataset
             **kwargs: additional parameters to be provided to the fit function
                       of the estimator
 
@@ -92,3 +136,18 @@ class FQI(Algorithm):
         self.partial_fit(sast, r, **kwargs)
         for t in range(1, self.horizon):
             self.partial_fit(sast=None, r=None, **kwargs)
+
+            if self.converged:
+                if self._verbose > 0:
+                    print('Converged after {} iterations'.format(
+                        self._iteration))
+                break
+
+    def reset(self):
+        """
+        Reset.
+        """
+        super(FQI, self).reset()
+        self._y = None
+        self.deltas = list()
+        self.converged = False
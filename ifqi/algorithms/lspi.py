@@ -1,56 +1,220 @@
 from __future__ import print_function
 
+import warnings
+
 import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
 
 from ifqi.algorithms.algorithm import Algorithm
 
 
+def _dense(x):
+    return x.toarray() if sp.issparse(x) else np.asarray(x)
+
+
+def _solve(A, b):
+    """
+    Solve the linear system A w = b with an LU factorization. When A is
+    singular (a pivot is negligible with respect to the largest one, as in
+    the rank test of numpy.linalg.matrix_rank) the pseudo-inverse is used.
+    Args:
+        A (numpy.array): the matrix of the system. Dimensions: (k x k)
+        b (numpy.array): the known terms. Dimensions: (k x 1)
+    Returns:
+        the solution. Dimensions: (k x 1)
+    """
+    with warnings.catch_warnings():
+        # singular matrices are handled below
+        warnings.simplefilter('ignore')
+        lu, piv = scipy.linalg.lu_factor(A, check_finite=False)
+    pivots = np.abs(np.diag(lu))
+    tol = pivots.max() * A.shape[0] * np.finfo(lu.dtype).eps
+    if pivots.min() > tol:
+        return scipy.linalg.lu_solve((lu, piv), b, check_finite=False)
+
+    return np.dot(np.linalg.pinv(A), b)
+
+
 class LSTDQ(Algorithm):
+    """
+    Least-Squares Temporal Difference Q-learning with a linear model of the
+    features of the state-action pairs. The matrices of the linear system
+    are accumulated a chunk of samples at a time (see chunk_size), hence the
+    feature matrices of the whole dataset are not stored unless
+    cache_features is true; sparse features (scipy.sparse matrices) are
+    supported.
+    """
+
     def __init__(self, estimator, state_dim, action_dim,
-                 discrete_actions, gamma, verbose=False):
+                 discrete_actions, gamma, verbose=False, chunk_size=None,
+                 cache_features=False):
+        """
+        Constructor.
+        Args:
+            chunk_size (int, None): the number of samples whose features are
+                computed at once. If None, all the samples are used together
+            cache_features (bool, False): whether to store the features of
+                the samples and of the next states paired with every
+                discrete action. Each iteration then selects the features of
+                the greedy actions instead of computing them and updates
+                the system only with the samples whose greedy action
+                changed, using memory for (n_actions + 1) feature matrices
+                of the dataset
+
+        See Algorithm for the other parameters.
+        """
         super(LSTDQ, self).__init__(estimator, state_dim, action_dim,
                                     discrete_actions, gamma, None,
-                                    verbose)
+                                    verbose, chunk_size)
+        self.cache_features = cache_features
+        self._phi_phi = None
+        self._phi_r = None
+        self._features = None
+        self._greedy = None
+        self._phi_next_phi = None
 
     def fit(self, sast=None, r=None, **kwargs):
         """
         Run LSTDQ using input data sast and r.
 
         Args:
-            sast (numpy.array): the input in the dataset
-            r (numpy.array): the output in the dataset
+            sast (numpy.array, TransitionDataset): the input in the dataset
+            r (numpy.array): the output in the dataset. It can be omitted
+                when sast is a TransitionDataset
             **kwargs: additional parameters to be provided to the fit function
                       of the estimator
         """
         if sast is not None:
-            next_states_idx = self.state_dim + self.action_dim
-            self._sa = sast[:, :next_states_idx]
-            self._snext = sast[:, next_states_idx:-1]
-            self._absorbing = sast[:, -1]
+            self._set_dataset(sast)
 
-            self._phi_hat = self._estimator.features.fit_transform(self._sa).T
             # to initialize the regressor
-            self._estimator.fit(self._sa, np.zeros((self._sa.shape[0], 1)))
+            sa = self._sa[:self.chunk_size or self._sa.shape[0]]
+            self._estimator.fit(sa, np.zeros((sa.shape[0], 1)))
+            self._phi_phi = None
+            self._phi_r = None
+            self._features = None
+            self._greedy = None
+            self._phi_next_phi = None
 
             self._iteration = 1
         if r is not None:
             self._r = r
+            self._phi_r = None
+
+        features = self._estimator.features
+        chunks = list(self._chunks(self._sa))
+        if self.cache_features and self._features is None:
+            self._features = [(features.transform(self._sa[chunk]),
+                               self._next_features(chunk))
+                              for chunk in chunks]
 
-        best_actions = self.draw_action(self._snext,
-                                        self._absorbing).reshape(-1, 1)
-        snext_anext = np.concatenate((self._snext, best_actions), axis=1)
-        pi_phi_hat = self._estimator.features.transform(snext_anext).T
+        def phi(i, chunk):
+            if self._features is not None:
+                return self._features[i][0]
+            return features.transform(self._sa[chunk])
 
-        A = np.dot(self._phi_hat, (self._phi_hat - self.gamma * pi_phi_hat).T)
-        b = np.dot(self._phi_hat, self._r.reshape(-1, 1))
+        if self._phi_phi is None or self._phi_r is None:
+            # the terms depending only on the dataset are computed once
+            phi_phi, phi_r = 0., 0.
+            for i, chunk in enumerate(chunks):
+                p = phi(i, chunk)
+                phi_phi = phi_phi + _dense(p.T.dot(p))
+                phi_r = phi_r + _dense(p.T.dot(
+                    np.asarray(self._r[chunk], dtype=float).reshape(-1, 1)))
+            self._phi_phi = phi_phi
+            self._phi_r = phi_r
 
-        if np.linalg.matrix_rank(A) == self._phi_hat.shape[0]:
-            w = np.linalg.solve(A, b)
+        # A = phi^T (phi - gamma * phi'), where phi' are the features of the
+        # next states with the greedy actions
+        if self._features is not None:
+            phi_next_phi = self._update_phi_next_phi(chunks)
         else:
-            w = np.dot(np.linalg.pinv(A), b)
+            phi_next_phi = 0.
+            for i, chunk in enumerate(chunks):
+                best_actions = self.draw_action(
+                    self._snext[chunk],
+                    self._absorbing[chunk]).reshape(-1, self.action_dim)
+                snext_anext = np.concatenate((self._snext[chunk],
+                                              best_actions), axis=1)
+                pi_phi = features.transform(snext_anext)
+                phi_next_phi = phi_next_phi + \
+                    _dense(phi(i, chunk).T.dot(pi_phi))
+
+        A = self._phi_phi - self.gamma * phi_next_phi
+        w = _solve(A, self._phi_r)
 
         self._estimator.set_weights(w.T)
 
+    def _next_features(self, chunk):
+        """
+        Compute the features of the next states of a chunk paired with every
+        discrete action.
+        Returns:
+            the features, stacked by action.
+            Dimensions: (n_actions * n_samples x n_features)
+        """
+        snext = self._snext[chunk]
+        blocks = list()
+        for action in self._actions.astype(float):
+            actions = np.tile(action, (snext.shape[0], 1))
+            blocks.append(self._estimator.features.transform(
+                np.concatenate((snext, actions), axis=1)))
+        if sp.issparse(blocks[0]):
+            return sp.vstack(blocks, format='csr')
+        return np.vstack(blocks)
+
+    def _greedy_actions(self, phi_next, absorbing):
+        """
+        Compute the greedy actions of the current weights in the next states
+        of a chunk, as chosen by draw_action (the constant term of the model
+        does not change the greedy actions).
+        Args:
+            phi_next (numpy.array, scipy.sparse matrix): the features of the
+                next states paired with every action (see _next_features)
+            absorbing (numpy.array): the absorbing flags of the next states
+        Returns:
+            the index of the greedy action of each next state
+        """
+        n_samples = phi_next.shape[0] // self._actions.shape[0]
+        w = np.asarray(self._estimator.get_weights(),
+                       dtype=float).reshape(-1, 1)
+        Q = _dense(phi_next.dot(w)).reshape(-1, n_samples).T
+        Q = Q * (1 - np.asarray(absorbing, dtype=float)).reshape(-1, 1)
+
+        return np.argmax(Q, axis=1)
+
+    def _update_phi_next_phi(self, chunks):
+        """
+        Compute phi^T phi' from the stored features. The product of the
+        previous iteration is updated with the samples whose greedy action
+        changed, since the others contribute the same terms.
+        Args:
+            chunks (list): the slices of the chunks of samples
+        Returns:
+            the matrix phi^T phi'
+        """
+        if self._greedy is None:
+            self._greedy = [None] * len(chunks)
+            self._phi_next_phi = 0.
+
+        for i, chunk in enumerate(chunks):
+            phi, phi_next = self._features[i]
+            n_samples = phi.shape[0]
+            greedy = self._greedy_actions(phi_next, self._absorbing[chunk])
+            old = self._greedy[i]
+            rows = np.arange(n_samples) if old is None \
+                else np.flatnonzero(greedy != old)
+            if rows.size > 0:
+                pi_phi = phi_next[greedy[rows] * n_samples + rows]
+                if old is not None:
+                    pi_phi = pi_phi - phi_next[old[rows] * n_samples + rows]
+                self._phi_next_phi = self._phi_next_phi + \
+                    _dense(phi[rows].T.dot(pi_phi))
+            self._greedy[i] = greedy
+
+        return self._phi_next_phi
+
 
 class LSPI(object):
     """
@@ -65,19 +229,22 @@ class LSPI(object):
     """
 
     def __init__(self, estimator, state_dim, action_dim,
-                 discrete_actions, gamma, epsilon=1e-6, verbose=False):
+                 discrete_actions, gamma, epsilon=1e-6, verbose=False,
+                 chunk_size=None, cache_features=False):
         self.__name__ = 'LSPI'
         self._epsilon = epsilon
         self._lstdq = LSTDQ(estimator, state_dim, action_dim,
-                            discrete_actions, gamma, verbose)
+                            discrete_actions, gamma, verbose, chunk_size,
+                            cache_features)
 
-    def fit(self, sast, r, **kwargs):
+    def fit(self, sast, r=None, **kwargs):
         """
         Run LSPI using input data sast and r.
 
         Args:
-            sast (numpy.array): the input in the dataset
-            r (numpy.array): the output in the dataset
+            sast (numpy.array, TransitionDataset): the input in the dataset
+            r (numpy.array, None): the output in the dataset. It can be
+                omitted when sast is a TransitionDataset
             **kwargs: additional parameters to be provided to the fit function
                       of the estimator
         """
@@ -58,15 +58,16 @@ class PBO(Algorithm):
                                   verbose)
         self._rho_values = []
 
-    def fit(self, sast, r):
+    def fit(self, sast, r=None):
         """
         Perform a run of PBO using input data sast and r.
         Note that if the dataset does not change between iterations, you can
         provide None inputs after the first iteration.
 
         Args:
-            sast (numpy.array, None): the input in the dataset
-            r (numpy.array, None): the output in the dataset
+            sast (numpy.array, TransitionDataset): the input in the dataset
+            r (numpy.array, None): the output in the dataset. It can be
+                omitted when sast is a TransitionDataset
             **kwargs: additional parameters to be provided to the fit function
             of the estimator
 
@@ -75,11 +76,9 @@ class PBO(Algorithm):
         """
         self.iteration_best_rho_value = np.inf
 
-        next_states_idx = self.state_dim + self.action_dim
-        self._sa = sast[:, :next_states_idx]
-        self._snext = sast[:, next_states_idx:-1]
-        self._absorbing = sast[:, -1]
-        self._r = r
+        self._set_dataset(sast)
+        if r is not None:
+            self._r = r
 
         optimizer = ExactNES(self._fitness, self._get_rho(),
                              minimize=True, batchSize=self._batch_size,
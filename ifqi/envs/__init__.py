@@ -9,8 +9,10 @@ from .swimmer import Swimmer
 from .swingPendulum import SwingPendulum
 from .synthetic import SyntheticToyFS
 from .utils import get_space_info
+from .vectorenv import SerialVectorEnv, VectorEnv, make_vector_env
 from .gridworld import GridWorldEnv
 from .atari import Atari
 
 __all__ = ['Acrobot', 'Atari', 'Bicycle', 'CarOnHill', 'CartPole', 'GridWorldEnv', 'Gym', 'InvPendulum',
-           'LQG1D', 'Swimmer', 'SwingPendulum', 'SyntheticToyFS']
+           'LQG1D', 'Swimmer', 'SwingPendulum', 'SerialVectorEnv', 'SyntheticToyFS',
+           'VectorEnv', 'make_vector_env']
@@ -1,9 +1,11 @@
 import gym
 import numpy as np
 from gym import spaces
-from scipy.integrate import odeint
+from gym.utils import seeding
 
 from ifqi.utils import spaces as fqispaces
+from .integrators import INTEGRATORS, integrate
+from .vectorenv import VectorEnv
 
 """
 The Acrobot environment as presented in:
@@ -22,7 +24,21 @@ class Acrobot(gym.Env):
         'video.frames_per_second': 15
     }
 
-    def __init__(self):
+    def __init__(self, integrator='odeint', n_substeps=10):
+        """
+        Constructor.
+        Args:
+            integrator (str, 'odeint'): the integrator of the dynamics, one
+                of ifqi.envs.integrators.INTEGRATORS. 'rk4' uses the
+                fourth-order Runge-Kutta method with adaptive steps and is
+                faster than odeint on vectorized environments
+            n_substeps (int, 10): the first step of rk4 in a transition
+                is 1 / n_substeps of the transition
+        """
+        assert integrator in INTEGRATORS, 'unknown integrator'
+        self._integrator = integrator
+        self._n_substeps = n_substeps
+
         self.horizon = 100
         self.gamma = .95
 
@@ -50,12 +66,9 @@ class Acrobot(gym.Env):
 
     def step(self, u, render=False):
         sa = np.append(self._state, u)
-        new_state = odeint(self._dpds,
-                           sa,
-                           [0, self._dt],
-                           rtol=1e-5, atol=1e-5, mxstep=2000)
+        new_state = self._integrate(sa[np.newaxis])
 
-        x = new_state[-1, :-1]
+        x = new_state[0, :-1]
 
         k = round((x[0] - np.pi) / (2 * np.pi))
         o = np.array([2 * k * np.pi + np.pi, 0., 0., 0.])
@@ -89,6 +102,10 @@ class Acrobot(gym.Env):
 
         return self.get_state()
 
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
     def render(self, mode='human', close=False):
         if close:
             if self.viewer is not None:
@@ -128,6 +145,23 @@ class Acrobot(gym.Env):
     def get_state(self):
         return self._state
 
+    def vectorize(self, n_envs):
+        """
+        Returns:
+            an AcrobotVector simulating n_envs episodes
+        """
+        return AcrobotVector(self, n_envs)
+
+    def _integrate(self, sa):
+        """
+        Integrate the dynamics of the state-action pairs in the rows of sa
+        for a transition.
+        """
+        # the fast rotations of the links require adaptive steps
+        return integrate(self._dpds, sa, self._dt, self._integrator,
+                         self._n_substeps, tol=1e-5, rtol=1e-5, atol=1e-5,
+                         mxstep=2000)
+
     def _dpds(self, state_action, t):
         theta1 = state_action[0]
         theta2 = state_action[1]
@@ -159,7 +193,8 @@ class Acrobot(gym.Env):
         diff_diff_theta2 = (u - self._mu2 * d_theta2 - d12 * diff_diff_theta1 -
                             c2 - phi2) / d22
 
-        return diff_theta1, diff_theta2, diff_diff_theta1, diff_diff_theta2, 0.
+        return diff_theta1, diff_theta2, diff_diff_theta1, diff_diff_theta2, \
+            0. * u
 
     def _wrap2pi(self, value):
         tmp = value - -np.pi
@@ -167,3 +202,44 @@ class Acrobot(gym.Env):
         tmp -= width * np.floor(tmp / width)
 
         return tmp + -np.pi
+
+
+class AcrobotVector(VectorEnv):
+    """
+    Vectorized Acrobot: the dynamics of all the episodes is integrated at
+    once with the integrator of the environment. The stacked system is
+    integrated with the steps required by its fastest episode, hence the
+    states drift from the ones of Acrobot.step (with odeint, about 2e-3
+    relative to the state after 20 transitions under random actions).
+    """
+
+    def _initial_states(self, n_envs):
+        states = np.zeros((n_envs, 4))
+        states[:, 0] = self.env._wrap2pi(
+            self.np_random.uniform(low=-np.pi + 1, high=np.pi - 1,
+                                   size=n_envs))
+
+        return states
+
+    def _set_states(self, states):
+        states = states.copy()
+        states[:, :2] = self.env._wrap2pi(states[:, :2])
+
+        return states
+
+    def _step(self, states, actions):
+        env = self.env
+        sa = np.column_stack((states, actions[:, 0]))
+        x = env._integrate(sa)[:, :-1]
+
+        k = np.round((x[:, 0] - np.pi) / (2 * np.pi))
+        o = np.zeros_like(x)
+        o[:, 0] = 2 * k * np.pi + np.pi
+        d = np.linalg.norm(x - o, axis=1)
+
+        x[:, :2] = env._wrap2pi(x[:, :2])
+
+        absorbing = d < 1
+        reward = np.where(absorbing, 1 - d, 0.)
+
+        return x, reward, absorbing
@@ -21,6 +21,8 @@ from gym.utils import seeding
 
 from builtins import range
 
+from .vectorenv import VectorEnv
+
 """
 TODO: to test
 """
@@ -134,10 +136,10 @@ class Bicycle(gym.Env):
         self.action_space = spaces.Discrete(nactions)
 
         # initialize state
-        self._seed()
-        self._reset()
+        self.seed()
+        self.reset()
 
-    def _reset(self, state=None):
+    def reset(self, state=None):
         self._absorbing = False
 
         psi = 0.
@@ -156,8 +158,8 @@ class Bicycle(gym.Env):
             4] = psi  # numpy.arctan((self.position[1]-self.position[0])/(self.position[2] - self.position[3]))
         return self._getState()
 
-    def _step(self, action, render=False):
-        intAction = int(action)
+    def step(self, action, render=False):
+        intAction = int(numpy.ravel(action)[0])
         T = 2. * ((intAction / 3) - 1)  # Torque on handle bars
         d = 0.02 * ((intAction % 3) - 1)  # Displacement of center of mass (in meters)
         # if self.noise > 0:
@@ -267,6 +269,17 @@ class Bicycle(gym.Env):
             reward = ret
         return self._getState(), reward, self._absorbing, {}
 
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def vectorize(self, n_envs):
+        """
+        Returns:
+            a BicycleVector simulating n_envs episodes
+        """
+        return BicycleVector(self, n_envs)
+
     def _unit_vector(self, vector):
         """ Returns the unit vector of the vector.  """
         return vector / numpy.linalg.norm(vector)
@@ -309,3 +322,142 @@ class Bicycle(gym.Env):
         while (x > numpy.pi):
             x -= 2.0 * numpy.pi
         return x
+
+
+class BicycleVector(VectorEnv):
+    """
+    Vectorized Bicycle. The internal state of each episode is the state of
+    the bicycle [omega, omega_dot, omega_ddot, theta, theta_dot] followed by
+    its position [x_f, y_f, x_b, y_b, psi]; initial states cannot be
+    provided, as in Bicycle.
+    """
+
+    def _initial_states(self, n_envs):
+        psi = 0.
+        states = numpy.zeros((n_envs, 10))
+        states[:, 7] = self.env._l * numpy.cos(psi)
+        states[:, 8] = self.env._l * numpy.sin(psi)
+        states[:, 9] = psi
+
+        return states
+
+    def _set_states(self, states):
+        return self._initial_states(states.shape[0])
+
+    def get_state(self):
+        return self._observe(self._state)
+
+    def _goal_angle(self, x_f, y_f, x_b, y_b):
+        goal = self.env._goal_loc / numpy.linalg.norm(self.env._goal_loc)
+        v = numpy.column_stack((x_f - x_b, y_f - y_b))
+        v /= numpy.linalg.norm(v, axis=1)[:, numpy.newaxis]
+        angle = numpy.arccos(numpy.clip(numpy.dot(v, goal), -1.0, 1.0))
+
+        return angle * numpy.pi / 180.
+
+    def _observe(self, states):
+        goal_angle = self._goal_angle(*states[:, 5:9].T)
+        return numpy.column_stack((states[:, [0, 1, 3, 4]], goal_angle))
+
+    @staticmethod
+    def _psi(x_f, y_f, x_b, y_b):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(
+                (x_f == x_b) & (y_f - y_b < 0), numpy.pi,
+                numpy.where(y_f - y_b > 0,
+                            numpy.arctan((x_b - x_f) / (y_f - y_b)),
+                            numpy.sign(x_b - x_f) * (numpy.pi / 2.) -
+                            numpy.arctan((y_f - y_b) / (x_b - x_f))))
+
+    @staticmethod
+    def _angle_wrap_pi(x):
+        return numpy.where(numpy.abs(x) <= numpy.pi, x,
+                           numpy.mod(x + numpy.pi, 2 * numpy.pi) - numpy.pi)
+
+    def _step(self, states, actions):
+        env = self.env
+        action = actions[:, 0]
+        T = 2. * ((action / 3) - 1)  # Torque on handle bars
+        d = 0.02 * ((action % 3) - 1)  # Displacement of center of mass
+
+        omega, omega_dot, omega_ddot, theta, theta_dot, \
+            x_f, y_f, x_b, y_b, psi = states.T.copy()
+
+        goal_angle_old = self._goal_angle(x_f, y_f, x_b, y_b)
+
+        for step in range(env._sim_steps):
+            # infinite radius tends to not be handled well
+            straight = theta == 0
+            with numpy.errstate(divide='ignore'):
+                r_f = numpy.where(straight, 1.e8,
+                                  env._l / numpy.abs(numpy.sin(theta)))
+                r_b = numpy.where(straight, 1.e8,
+                                  env._l / numpy.abs(numpy.tan(theta)))
+                r_CM = numpy.where(straight, 1.e8,
+                                   numpy.sqrt((env._l - env._c) ** 2 +
+                                              (env._l ** 2 /
+                                               numpy.tan(theta) ** 2)))
+
+            varphi = omega + numpy.arctan(d / env._h)
+
+            omega_ddot = env._h * env._M * env._gravity * numpy.sin(varphi)
+            omega_ddot -= numpy.cos(varphi) * \
+                (env._Inertia_dv * env._sigma_dot * theta_dot +
+                 numpy.sign(theta) * env._v ** 2 *
+                 (env._M_d * env._r * (1. / r_f + 1. / r_b) +
+                  env._M * env._h / r_CM))
+            omega_ddot /= env._Inertia_bc
+
+            theta_ddot = (T - env._Inertia_dv * env._sigma_dot *
+                          omega_dot) / env._Inertia_dl
+
+            df = (env._delta_time / float(env._sim_steps))
+            omega_dot = omega_dot + df * omega_ddot
+            omega = omega + df * omega_dot
+            theta_dot = theta_dot + df * theta_ddot
+            theta = theta + df * theta_dot
+
+            # Handle bar limits (80 deg.)
+            theta = numpy.clip(theta, env._state_range[3, 0],
+                               env._state_range[3, 1])
+
+            # Update position (x,y) of tires
+            front_term = psi + theta + numpy.sign(psi + theta) * \
+                numpy.arcsin(env._v * df / (2. * r_f))
+            back_term = psi + numpy.sign(psi) * \
+                numpy.arcsin(env._v * df / (2. * r_b))
+            x_f = x_f - numpy.sin(front_term)
+            y_f = y_f + numpy.cos(front_term)
+            x_b = x_b - numpy.sin(back_term)
+            y_b = y_b + numpy.cos(back_term)
+
+            # Handle Roundoff errors, to keep the length of the bicycle
+            # constant
+            dist = numpy.sqrt((x_f - x_b) ** 2 + (y_f - y_b) ** 2)
+            fix = numpy.abs(dist - env._l) > 0.01
+            x_b = numpy.where(fix, x_b + (x_b - x_f) * (env._l - dist) / dist,
+                              x_b)
+            y_b = numpy.where(fix, y_b + (y_b - y_f) * (env._l - dist) / dist,
+                              y_b)
+
+            psi = self._psi(x_f, y_f, x_b, y_b)
+
+        new_states = numpy.column_stack((omega, omega_dot, omega_ddot, theta,
+                                         theta_dot, x_f, y_f, x_b, y_b, psi))
+
+        fallen = numpy.abs(omega) > env._state_range[0, 1]
+        if env._navigate:
+            at_goal = numpy.sqrt(numpy.maximum(
+                0., ((new_states[:, 5:7] - env._goal_loc) ** 2).sum(axis=1) -
+                env._goal_rsqrd)) < 1.e-5
+            goal_angle = self._goal_angle(x_f, y_f, x_b, y_b)
+            shaping = 0.1 * (self._angle_wrap_pi(goal_angle_old) -
+                             self._angle_wrap_pi(goal_angle))
+        else:
+            at_goal = numpy.zeros(states.shape[0], dtype=bool)
+            shaping = env._reward_shaping
+
+        reward = numpy.where(fallen, -1.0,
+                             numpy.where(at_goal, env._reward_goal, shaping))
+
+        return new_states, reward, fallen | at_goal
@@ -4,9 +4,10 @@ from builtins import range
 from gym import spaces
 from gym.envs.registration import register
 from gym.utils import seeding
-from scipy.integrate import odeint
 
 import ifqi.utils.spaces as fqispaces
+from .integrators import INTEGRATORS, integrate
+from .vectorenv import VectorEnv
 
 
 
@@ -27,7 +28,22 @@ class CarOnHill(gym.Env):
         'video.frames_per_second': 15
     }
 
-    def __init__(self):
+    def __init__(self, integrator='odeint', n_substeps=10):
+        """
+        Constructor.
+        Args:
+            integrator (str, 'odeint'): the integrator of the dynamics, one
+                of ifqi.envs.integrators.INTEGRATORS. 'rk4' uses n_substeps
+                fixed steps of the fourth-order Runge-Kutta method and is
+                faster than odeint on vectorized environments. Its error
+                reaches 1e-2 on the transitions crossing the bottom of the
+                hill, where the acceleration is not continuous
+            n_substeps (int, 10): the number of steps of rk4 in a transition
+        """
+        assert integrator in INTEGRATORS, 'unknown integrator'
+        self._integrator = integrator
+        self._n_substeps = n_substeps
+
         self.horizon = 100
         self.gamma = 0.95
 
@@ -58,9 +74,9 @@ class CarOnHill(gym.Env):
 
     def step(self, u):
         sa = np.append(self._state, u)
-        new_state = odeint(self._dpds, sa, [0, self._dt])
+        new_state = self._integrate(sa[np.newaxis])
 
-        self._state = new_state[-1, :-1]
+        self._state = new_state[0, :-1]
 
         if self._state[0] < -self.max_pos or \
                 np.abs(self._state[1]) > self.max_velocity:
@@ -87,23 +103,75 @@ class CarOnHill(gym.Env):
     def get_state(self):
         return self._state
 
+    def vectorize(self, n_envs):
+        """
+        Returns:
+            a CarOnHillVector simulating n_envs episodes
+        """
+        return CarOnHillVector(self, n_envs)
+
+    def _integrate(self, sa):
+        """
+        Integrate the dynamics of the state-action pairs in the rows of sa
+        for a transition.
+        """
+        return integrate(self._dpds, sa, self._dt, self._integrator,
+                         self._n_substeps)
+
     def _dpds(self, state_action, t):
+        # also computes the derivatives of a batch of states, stacked by
+        # columns (see CarOnHillVector)
         position = state_action[0]
         velocity = state_action[1]
         u = state_action[-1]
 
-        if position < 0.:
-            diff_hill = 2 * position + 1
-            diff_2_hill = 2
+        if not isinstance(position, np.ndarray):
+            # np.where is much slower than a branch on a single state
+            if position < 0.:
+                diff_hill = 2 * position + 1
+                diff_2_hill = 2
+            else:
+                diff_hill = 1 / ((1 + 5 * position ** 2) ** 1.5)
+                diff_2_hill = (-15 * position) / \
+                    ((1 + 5 * position ** 2) ** 2.5)
         else:
-            diff_hill = 1 / ((1 + 5 * position ** 2) ** 1.5)
-            diff_2_hill = (-15 * position) / ((1 + 5 * position ** 2) ** 2.5)
+            uphill = position >= 0.
+            diff_hill = np.where(uphill,
+                                 1 / ((1 + 5 * position ** 2) ** 1.5),
+                                 2 * position + 1)
+            diff_2_hill = np.where(uphill,
+                                   (-15 * position) /
+                                   ((1 + 5 * position ** 2) ** 2.5),
+                                   2)
 
         dp = velocity
         ds = (u - self._g * self._m * diff_hill - velocity ** 2 * self._m *
               diff_hill * diff_2_hill) / (self._m * (1 + diff_hill ** 2))
 
-        return dp, ds, 0.
+        return dp, ds, 0. * u
 
     def _render(self, mode=None, close=None):
         pass
+
+
+class CarOnHillVector(VectorEnv):
+    """
+    Vectorized CarOnHill: the dynamics of all the episodes is integrated
+    at once with the integrator of the environment.
+    """
+
+    def _initial_states(self, n_envs):
+        return np.tile([-0.5, 0.], (n_envs, 1))
+
+    def _step(self, states, actions):
+        env = self.env
+        sa = np.column_stack((states, actions[:, 0]))
+        new_states = env._integrate(sa)[:, :-1]
+
+        position = new_states[:, 0]
+        velocity = np.abs(new_states[:, 1])
+        lost = (position < -env.max_pos) | (velocity > env.max_velocity)
+        won = ~lost & (position > env.max_pos)
+        reward = np.where(lost, -1., np.where(won, 1., 0.))
+
+        return new_states, reward, lost | won
@@ -0,0 +1,136 @@
+import numpy as np
+from scipy.integrate import odeint
+
+"""
+Integrators of the ordinary differential equations of the environments.
+The derivatives are computed by functions with the signature of the _dpds
+functions of the environments: they receive the transposed states
+(dim x n_systems) and the time and return a sequence of dim arrays, hence
+a batch of independent systems is integrated at once.
+"""
+
+INTEGRATORS = ['odeint', 'rk4']
+
+
+def batch_odeint(func, y0, t, **kwargs):
+    """
+    Integrate independent systems of ordinary differential equations with
+    a single call to odeint, stacking their states in one system. The
+    maximum number of steps (mxstep, 500 by default) is meant for each
+    system, since the stacked system is integrated with the steps required
+    by all of them.
+
+    Args:
+        func (function): function computing the derivatives of the systems
+        y0 (numpy.array): the initial states. Dimensions: (n_systems x dim)
+        t (list): the times (see odeint)
+        **kwargs: additional parameters to be provided to odeint
+    Returns:
+        the states at the last time. Dimensions: (n_systems x dim)
+    """
+    n_systems, dim = y0.shape
+    kwargs['mxstep'] = kwargs.get('mxstep', 500) * n_systems
+
+    def dpds(y, t):
+        return np.column_stack(func(y.reshape(n_systems, dim).T, t)).ravel()
+
+    return odeint(dpds, y0.ravel(), t, **kwargs)[-1].reshape(n_systems, dim)
+
+
+def rk4(func, y0, dt, n_substeps=1, tol=None):
+    """
+    Integrate independent systems of ordinary differential equations with
+    the classic fourth-order Runge-Kutta method, using n_substeps steps of
+    fixed length. Fixed steps diverge when the dynamics is stiff (e.g. the
+    fast rotations of Acrobot): in that case provide tol, so that the steps
+    are adapted to keep the error estimated by step doubling below tol and
+    n_substeps only sets the length of the first step.
+
+    Args:
+        func (function): function computing the derivatives of the systems
+        y0 (numpy.array): the initial states. Dimensions: (n_systems x dim)
+        dt (float): the integration time
+        n_substeps (int, 1): the number of steps
+        tol (float, None): the tolerance on the error of a step, relative
+            to 1 + |y|. If None, the steps are not adapted
+    Returns:
+        the states at time dt. Dimensions: (n_systems x dim)
+    """
+    # the states are stored by columns, as expected by func
+    def f(y, t):
+        return np.array(func(y, t))
+
+    def step(y, t, h, k1):
+        k2 = f(y + h / 2. * k1, t + h / 2.)
+        k3 = f(y + h / 2. * k2, t + h / 2.)
+        k4 = f(y + h * k3, t + h)
+        return y + h / 6. * (k1 + 2. * k2 + 2. * k3 + k4)
+
+    h = float(dt) / n_substeps
+    y = np.array(y0, dtype=float).T
+    if y.shape[1] == 1:
+        # scalar operations are much faster on a single system
+        y = y[:, 0]
+    t = 0.
+    if tol is None:
+        for _ in range(n_substeps):
+            y = step(y, t, h, f(y, t))
+            t += h
+    else:
+        while t < dt:
+            last = h >= dt - t
+            if last:
+                h = dt - t
+            k1 = f(y, t)
+            full = step(y, t, h, k1)
+            half = step(y, t, h / 2., k1)
+            half = step(half, t + h / 2., h / 2., f(half, t + h / 2.))
+            error = np.max(np.abs(half - full) / (1. + np.abs(half))) / 15.
+            if error <= tol:
+                y = half
+                t = dt if last else t + h
+            elif not error > tol:
+                # the step produced non-finite states
+                error = np.inf
+            h *= min(4., max(.1, .9 * (tol / error) ** .2)) if error > 0 \
+                else 4.
+            if h < dt * 1e-9:
+                raise ValueError('the integration step underflowed.')
+
+    return y.reshape(y0.shape[::-1]).T
+
+
+def integrate(func, y0, dt, integrator='odeint', n_substeps=10, tol=None,
+              **kwargs):
+    """
+    Integrate independent systems of ordinary differential equations for
+    a time dt with the selected integrator.
+
+    Args:
+        func (function): function computing the derivatives of the systems
+        y0 (numpy.array): the initial states. Dimensions: (n_systems x dim)
+        dt (float): the integration time
+        integrator (str, 'odeint'): the integrator, one of INTEGRATORS
+        n_substeps (int, 10): the number of steps of rk4
+        tol (float, None): the tolerance of the adaptive steps of rk4 (see
+            rk4)
+        **kwargs: additional parameters to be provided to odeint
+    Returns:
+        the states at time dt. Dimensions: (n_systems x dim)
+    """
+    if integrator == 'odeint':
+        if y0.shape[0] == 1:
+            # stacking the states only slows down a single system
+            y = odeint(func, y0[0], [0, dt], **kwargs)[-1:]
+        else:
+            y = batch_odeint(func, y0, [0, dt], **kwargs)
+    elif integrator == 'rk4':
+        y = rk4(func, y0, dt, n_substeps, tol)
+    else:
+        raise ValueError('unknown integrator {}.'.format(integrator))
+
+    if not np.all(np.isfinite(y)):
+        raise ValueError('the integration with {} diverged to non-finite '
+                         'states.'.format(integrator))
+
+    return y
@@ -3,6 +3,7 @@ import numpy as np
 from gym import spaces
 
 import ifqi.utils.spaces as fqispaces
+from .vectorenv import VectorEnv
 
 
 class InvPendulum(gym.Env):
@@ -19,9 +20,6 @@ class InvPendulum(gym.Env):
         self.horizon = 400
         self.gamma = .95
 
-        self._theta = 0.
-        self._theta_dot = 0.
-
         self._g = 9.8
         self._m = 2.
         self._M = 8.
@@ -43,26 +41,34 @@ class InvPendulum(gym.Env):
         self.reset()
 
     def step(self, u):
-        n_u = u + 2 * self._noise * np.random.rand() - self._noise
-
-        a = self._g * np.sin(self._theta) - self._alpha * self._m * self._l * \
-            (self._theta_dot ** 2) * np.sin(2 * self._theta) / 2. \
-            - self._alpha * np.cos(self._theta) * n_u
-        b = 4. * self._l / 3. \
-            - self._alpha * self._m * self._l * (np.cos(self._theta)) ** 2
-
-        theta_ddot = a / b
-
-        self._theta_dot = self._theta_dot + self._dt * theta_ddot
-        self._theta = self._theta + self._dt * self._theta_dot
+        theta, theta_dot = self._transition(self.state[0], self.state[1],
+                                            np.ravel(u)[0], np.random.rand())
+        self.state = np.array([theta, theta_dot])
 
         reward = 0
-        if np.abs(self._theta) > self._angle_max:
+        if np.abs(theta) > self._angle_max:
             self._absorbing = True
             reward = -1
 
         return self.get_state(), reward, self._absorbing, {}
 
+    def _transition(self, theta, theta_dot, u, rand):
+        # also computes the transitions of a batch of states
+        n_u = u + 2 * self._noise * rand - self._noise
+
+        a = self._g * np.sin(theta) - self._alpha * self._m * self._l * \
+            (theta_dot ** 2) * np.sin(2 * theta) / 2. \
+            - self._alpha * np.cos(theta) * n_u
+        b = 4. * self._l / 3. \
+            - self._alpha * self._m * self._l * (np.cos(theta)) ** 2
+
+        theta_ddot = a / b
+
+        theta_dot = theta_dot + self._dt * theta_ddot
+        theta = theta + self._dt * theta_dot
+
+        return theta, theta_dot
+
     def reset(self, state=None):
         self._absorbing = False
         if state is None:
@@ -74,3 +80,29 @@ class InvPendulum(gym.Env):
 
     def get_state(self):
         return self.state
+
+    def vectorize(self, n_envs):
+        """
+        Returns:
+            an InvPendulumVector simulating n_envs episodes
+        """
+        return InvPendulumVector(self, n_envs)
+
+
+class InvPendulumVector(VectorEnv):
+    """
+    Vectorized InvPendulum.
+    """
+
+    def _initial_states(self, n_envs):
+        return np.zeros((n_envs, 2))
+
+    def _step(self, states, actions):
+        env = self.env
+        theta, theta_dot = env._transition(states[:, 0], states[:, 1],
+                                           actions[:, 0],
+                                           np.random.rand(states.shape[0]))
+        absorbing = np.abs(theta) > env._angle_max
+        reward = np.where(absorbing, -1., 0.)
+
+        return np.column_stack((theta, theta_dot)), reward, absorbing
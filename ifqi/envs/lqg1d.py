@@ -6,6 +6,8 @@ from gym import spaces
 from gym.utils import seeding
 import numpy as np
 
+from .vectorenv import VectorEnv
+
 """
 Linear quadratic gaussian regulator task.
 
@@ -76,7 +78,7 @@ class LQG1D(gym.Env):
             if abs(self.state[0]) <= 2 and abs(u) <= 2:
                 return self.get_state(), 0, False, {}
             return self.get_state(), -1, False, {}
-        return self.get_state(), -np.asscalar(cost), False, {}
+        return self.get_state(), -cost.item(), False, {}
 
     def reset(self, state=None):
         if state is None:
@@ -94,6 +96,13 @@ class LQG1D(gym.Env):
         self.np_random, seed = seeding.np_random(seed)
         return [seed]
 
+    def vectorize(self, n_envs):
+        """
+        Returns:
+            a LQG1DVector simulating n_envs episodes
+        """
+        return LQG1DVector(self, n_envs)
+
     def _render(self, mode='human', close=False):
         if close:
             if self.viewer is not None:
@@ -329,3 +338,30 @@ class LQG1D(gym.Env):
         #
         #     P = self.to_mat(vecP)
         #     return P
+
+
+class LQG1DVector(VectorEnv):
+    """
+    Vectorized LQG1D.
+    """
+
+    def _initial_states(self, n_envs):
+        return self.np_random.uniform(low=-self.env.max_pos,
+                                      high=self.env.max_pos,
+                                      size=(n_envs, 1))
+
+    def _step(self, states, actions):
+        env = self.env
+        u = np.clip(actions, -env.max_action, env.max_action)
+        noise = self.np_random.randn(states.shape[0], 1) * env.sigma_noise
+        xn = np.dot(states, env.A.T) + np.dot(u, env.B.T) + noise
+        cost = np.sum(states * np.dot(states, env.Q.T), axis=1) + \
+            np.sum(u * np.dot(u, env.R.T), axis=1)
+
+        if env.discrete_reward:
+            reward = np.where((np.abs(xn[:, 0]) <= 2) &
+                              (np.abs(u[:, 0]) <= 2), 0., -1.)
+        else:
+            reward = -cost
+
+        return xn, reward, np.zeros(states.shape[0], dtype=bool)
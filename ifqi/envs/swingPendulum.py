@@ -10,8 +10,10 @@ Pendulum as described in Reinforcement Learning in Continuous Time and Space
 import gym
 import numpy as np
 from gym import spaces
+from gym.utils import seeding
 
 import ifqi.utils.spaces as fqispaces
+from .vectorenv import VectorEnv
 
 
 class SwingPendulum(gym.Env):
@@ -40,7 +42,7 @@ class SwingPendulum(gym.Env):
         self.seed()
         self.reset()
 
-    def _step(self, action, render=False):
+    def step(self, action, render=False):
         u = action[0]
         theta, theta_dot = tuple(self.get_state())
 
@@ -79,3 +81,47 @@ class SwingPendulum(gym.Env):
 
     def get_state(self):
         return self._state
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def vectorize(self, n_envs):
+        """
+        Returns:
+            a SwingPendulumVector simulating n_envs episodes
+        """
+        return SwingPendulumVector(self, n_envs)
+
+
+class SwingPendulumVector(VectorEnv):
+    """
+    Vectorized SwingPendulum.
+    """
+
+    def _initial_states(self, n_envs):
+        states = np.zeros((n_envs, 2))
+        states[:, 0] = self.np_random.uniform(low=-np.pi, high=np.pi,
+                                              size=n_envs)
+
+        return states
+
+    def _step(self, states, actions):
+        env = self.env
+        u = actions[:, 0]
+        theta, theta_dot = states[:, 0], states[:, 1]
+
+        theta_ddot = (-env._dt * theta_dot + env._m * env._l * env._g *
+                      np.sin(theta_dot) + u)
+
+        # bound theta_dot
+        theta_dot = np.clip(theta_dot + theta_ddot, -np.pi / env._dt,
+                            np.pi / env._dt)
+        theta = theta + theta_dot * env._dt
+
+        # adjust theta
+        theta = np.where(theta > np.pi, theta - 2 * np.pi, theta)
+        theta = np.where(theta < -np.pi, theta + 2 * np.pi, theta)
+
+        return np.column_stack((theta, theta_dot)), np.cos(theta), \
+            np.zeros(states.shape[0], dtype=bool)
@@ -0,0 +1,173 @@
+import copy
+import sys
+if sys.version_info[0] < 3:
+    from inspect import getargspec
+else:
+    from inspect import signature
+
+import numpy as np
+
+
+def make_vector_env(env, n_envs):
+    """
+    Build a vectorized environment simulating n_envs episodes of env.
+
+    Args:
+        env (object): the environment
+        n_envs (int): the number of episodes simulated at once
+    Returns:
+        the vectorized implementation of env when it provides one (see the
+        vectorize method of the environments), otherwise a SerialVectorEnv
+    """
+    if hasattr(env, 'vectorize'):
+        return env.vectorize(n_envs)
+    return SerialVectorEnv(env, n_envs)
+
+
+class VectorEnv(object):
+    """
+    This class is the interface of the environments simulating a batch of
+    independent episodes at once, stepping all the states with array
+    operations. States, actions and rewards are stacked by rows (one row for
+    each episode); an episode that reaches an absorbing state is not
+    simulated anymore: its state is kept and its rewards are zero.
+    Vectorized environments are built with make_vector_env.
+    """
+
+    def __init__(self, env, n_envs):
+        """
+        Constructor.
+        Args:
+            env (object): the environment whose dynamics is simulated. Its
+                parameters are shared by the vectorized environment
+            n_envs (int): the number of episodes simulated at once
+        """
+        self.env = env
+        self.n_envs = n_envs
+
+        self.horizon = getattr(env, 'horizon', None)
+        self.gamma = getattr(env, 'gamma', None)
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        self.np_random = getattr(env, 'np_random', np.random)
+
+        self.absorbing = np.zeros(n_envs, dtype=bool)
+        self._state = None
+
+    def seed(self, seed=None):
+        self.np_random = np.random.RandomState(seed)
+
+    def reset(self, states=None):
+        """
+        Start a new batch of episodes.
+        Args:
+            states (numpy.array, None): the initial states.
+                Dimensions: (n_envs x state_dim). If None, they are chosen
+                by the environment
+        Returns:
+            the initial states
+        """
+        self.absorbing = np.zeros(self.n_envs, dtype=bool)
+        if states is None:
+            self._state = self._initial_states(self.n_envs)
+        else:
+            states = np.array(states, dtype=float).reshape(self.n_envs, -1)
+            self._state = self._set_states(states)
+
+        return self.get_state()
+
+    def step(self, actions):
+        """
+        Step the episodes that did not reach an absorbing state.
+        Args:
+            actions (numpy.array): the actions.
+                Dimensions: (n_envs x action_dim)
+        Returns:
+            the next states, the rewards, the absorbing flags and an empty
+            info dictionary
+        """
+        actions = np.asarray(actions, dtype=float).reshape(self.n_envs, -1)
+        active = ~self.absorbing
+        reward = np.zeros(self.n_envs)
+        if np.any(active):
+            state, r, absorbing = self._step(self._state[active],
+                                             actions[active])
+            self._state[active] = state
+            reward[active] = r
+            self.absorbing[active] = absorbing
+
+        return self.get_state(), reward, self.absorbing.copy(), {}
+
+    def get_state(self):
+        return self._state.copy()
+
+    def _initial_states(self, n_envs):
+        """
+        Returns:
+            the internal states of n_envs new episodes
+        """
+        raise NotImplementedError
+
+    def _set_states(self, states):
+        """
+        Returns:
+            the internal states of the episodes starting in the provided
+            states
+        """
+        return states
+
+    def _step(self, states, actions):
+        """
+        Compute the transitions of the provided internal states.
+        Returns:
+            the next internal states, the rewards and the absorbing flags
+        """
+        raise NotImplementedError
+
+
+class SerialVectorEnv(VectorEnv):
+    """
+    Vectorized environment stepping independent copies of an environment
+    one at a time. It provides the VectorEnv interface for the environments
+    without a vectorized implementation, so that the policy can still be
+    queried once per step with the states of all the episodes.
+    """
+
+    def __init__(self, env, n_envs):
+        super(SerialVectorEnv, self).__init__(env, n_envs)
+
+        self.envs = [copy.deepcopy(env) for _ in range(n_envs)]
+        if hasattr(env, 'np_random'):
+            # the copies would share the same random sequence
+            for e in self.envs:
+                e.seed(self.np_random.randint(2 ** 31 - 1))
+
+        if sys.version_info[0] < 3:
+            self._reset_state = len(getargspec(env.reset).args) > 1
+        else:
+            self._reset_state = len(signature(env.reset).parameters) > 0
+
+    def seed(self, seed=None):
+        super(SerialVectorEnv, self).seed(seed)
+        for e in self.envs:
+            if hasattr(e, 'np_random'):
+                e.seed(self.np_random.randint(2 ** 31 - 1))
+
+    def _initial_states(self, n_envs):
+        return np.array([np.ravel(e.reset()) for e in self.envs], dtype=float)
+
+    def _set_states(self, states):
+        if not self._reset_state:
+            return self._initial_states(self.n_envs)
+        return np.array([np.ravel(e.reset(s))
+                         for e, s in zip(self.envs, states)], dtype=float)
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=float).reshape(self.n_envs, -1)
+        reward = np.zeros(self.n_envs)
+        for i in np.flatnonzero(~self.absorbing):
+            state, reward[i], absorbing, _ = self.envs[i].step(actions[i])
+            self._state[i] = np.ravel(state)
+            self.absorbing[i] = absorbing
+
+        return self.get_state(), reward, self.absorbing.copy(), {}
@@ -1,5 +1,9 @@
 # from evaluation import evaluate_policy, collectEpisode
 #
 # __all__ = ["evaluate_policy", "collectEpisode"]
-from .utils import check_dataset
-__all__ = ['check_dataset']
\ No newline at end of file
+from .dataset import DatasetWriter, EpisodeIndex, TransitionDataset
+from .policies import CachedPolicy, SharedPolicy
+from .utils import check_dataset, find_invalid_transitions
+__all__ = ['CachedPolicy', 'DatasetWriter', 'EpisodeIndex', 'SharedPolicy',
+           'TransitionDataset', 'check_dataset',
+           'find_invalid_transitions']
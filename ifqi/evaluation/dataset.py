@@ -0,0 +1,437 @@
+import json
+import os
+
+import numpy as np
+
+"""
+Columnar storage of the transitions of a dataset.
+
+On disk, a dataset is a directory containing a header.json file, with the
+dimensions, the type and the number of the stored transitions, and a raw
+binary file for each column (e.g. sa.bin) containing the C-ordered rows of
+that column. New transitions are appended at the end of the column files and
+the header is updated afterwards, hence readers never see partially written
+transitions. The offsets of the ends of the episodes are stored as well
+(episode_ends.bin), so that episodes are selected without reading the
+dataset (see EpisodeIndex).
+"""
+
+HEADER = 'header.json'
+EPISODE_ENDS = 'episode_ends.bin'
+
+
+def _column_widths(state_dim, action_dim, reward_dim):
+    return {'sa': state_dim + action_dim,
+            'reward': reward_dim,
+            'next_state': state_dim,
+            'absorbing': 1,
+            'end': 1}
+
+
+def _read_header(path):
+    with open(os.path.join(path, HEADER)) as f:
+        return json.load(f)
+
+
+def _write_header(path, header):
+    # the header is replaced atomically
+    tmp = os.path.join(path, HEADER + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(header, f)
+    # os.rename does not overwrite an existing file on Windows
+    replace = getattr(os, 'replace', os.rename)
+    replace(tmp, os.path.join(path, HEADER))
+
+
+class EpisodeIndex(object):
+    """
+    This class stores the offsets of the episodes of a dataset: episode i
+    contains the transitions starts[i]:ends[i]. The transitions following
+    the last end-of-episode flag form an incomplete last episode.
+    """
+
+    def __init__(self, ends, n_samples=None, reward=None):
+        """
+        Constructor.
+        Args:
+            ends (numpy.array): the offset following the last transition of
+                each complete episode
+            n_samples (int, None): the number of transitions of the dataset.
+                If None, the dataset ends with the last complete episode
+            reward (numpy.array, None): the rewards of the dataset, used to
+                compute the returns of the episodes
+        """
+        ends = np.asarray(ends, dtype=np.int64)
+        if n_samples is not None and \
+                n_samples > (ends[-1] if ends.size > 0 else 0):
+            ends = np.append(ends, n_samples)
+        self.ends = ends
+        self.starts = np.concatenate(([0], ends[:-1])).astype(np.int64)
+        self._reward = reward
+        self._returns = None
+
+    @classmethod
+    def from_end_flags(cls, end, reward=None):
+        """
+        Build the index of a dataset from its end-of-episode flags.
+        Args:
+            end (numpy.array): the end-of-episode flags
+            reward (numpy.array, None): the rewards of the dataset
+        Returns:
+            the index
+        """
+        return cls(np.flatnonzero(np.asarray(end) == 1) + 1, len(end), reward)
+
+    def __len__(self):
+        return self.ends.shape[0]
+
+    @property
+    def lengths(self):
+        return self.ends - self.starts
+
+    @property
+    def returns(self):
+        """
+        The undiscounted return of each episode.
+        """
+        if self._returns is None:
+            if self._reward is None:
+                raise ValueError('The rewards of the dataset are unknown.')
+            if len(self) == 0:
+                self._returns = np.zeros((0,) + self._reward.shape[1:])
+            else:
+                self._returns = np.add.reduceat(
+                    np.asarray(self._reward, dtype=float), self.starts,
+                    axis=0)
+        return self._returns
+
+    def prefix(self, n_episodes):
+        """
+        Returns:
+            the number of transitions of the first n_episodes episodes
+        """
+        return int(self.ends[n_episodes - 1]) if n_episodes > 0 else 0
+
+    def rows(self, episodes):
+        """
+        Args:
+            episodes (numpy.array): indices of episodes, possibly repeated
+        Returns:
+            the indices of the transitions of the episodes, in the provided
+            order
+        """
+        episodes = np.asarray(episodes, dtype=np.int64)
+        lengths = self.lengths[episodes]
+        # offset of each row from the start of the selection
+        shift = np.repeat(self.starts[episodes] - np.cumsum(lengths) + lengths,
+                          lengths)
+        return np.arange(shift.shape[0]) + shift
+
+    def sample(self, n_episodes, replace=False, random_state=None):
+        """
+        Draw a random subset of the episodes, or a bootstrap sample when
+        replace is true.
+        Args:
+            n_episodes (int): the number of episodes
+            replace (bool, False): whether episodes can be drawn more than
+                once
+            random_state (int, RandomState, None): the random generator or
+                its seed. If None, the numpy generator is used
+        Returns:
+            the indices of the drawn episodes
+        """
+        if random_state is None:
+            random_state = np.random
+        elif not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+        return random_state.choice(len(self), n_episodes, replace=replace)
+
+
+class TransitionDataset(object):
+    """
+    This class stores a dataset of transitions by columns: the
+    state-action pairs, the rewards, the next states, the absorbing flags
+    and the end-of-episode flags are kept in separate contiguous arrays.
+    States and actions share a single matrix, so that the input of the
+    regressors is available without copies.
+    It can be provided to FQI, LSPI and PBO in place of the sast matrix and
+    to the functions in ifqi.evaluation.utils in place of the flat dataset.
+    """
+
+    COLUMNS = ['sa', 'reward', 'next_state', 'absorbing', 'end']
+
+    def __init__(self, sa, reward, next_state, absorbing, end, state_dim):
+        """
+        Constructor. Arrays are stored as they are provided, use from_array
+        to build a dataset from the flat representation returned by
+        collect_episodes.
+
+        Args:
+            sa (numpy.array): states and actions.
+                              Dimensions: (nsamples x state_dim + action_dim)
+            reward (numpy.array): rewards. Dimensions: (nsamples)
+            next_state (numpy.array): next states.
+                                      Dimensions: (nsamples x state_dim)
+            absorbing (numpy.array): absorbing flags. Dimensions: (nsamples)
+            end (numpy.array): end-of-episode flags. Dimensions: (nsamples)
+            state_dim (int): state dimensionality
+        """
+        self.sa = sa
+        self.reward = reward
+        self.next_state = next_state
+        self.absorbing = absorbing
+        self.end = end
+
+        self.state_dim = state_dim
+        self.action_dim = sa.shape[1] - state_dim
+        self.reward_dim = 1 if reward.ndim == 1 else reward.shape[1]
+
+        self._episodes = None
+
+    @classmethod
+    def from_array(cls, dataset, state_dim, action_dim, reward_dim=1,
+                   dtype='float32', copy=True):
+        """
+        Build the columnar dataset from the flat representation
+        [state, action, reward, next state, absorbing, end].
+
+        Args:
+            dataset (numpy.array): the flat dataset
+            state_dim (int): state dimensionality
+            action_dim (int): action dimensionality
+            reward_dim (int, 1): reward dimensionality
+            dtype (str, 'float32'): type of the stored arrays
+            copy (bool, True): if False, the columns are views of the flat
+                dataset, which is neither copied nor converted to dtype
+        Returns:
+            the dataset
+        """
+        reward_idx = state_dim + action_dim
+        nextstate_idx = reward_idx + reward_dim
+
+        def column(block):
+            if not copy:
+                return block
+            return np.ascontiguousarray(block, dtype=dtype)
+
+        reward = dataset[:, reward_idx:nextstate_idx]
+        if reward_dim == 1:
+            reward = reward[:, 0]
+
+        return cls(column(dataset[:, :reward_idx]),
+                   column(reward),
+                   column(dataset[:, nextstate_idx:nextstate_idx + state_dim]),
+                   column(dataset[:, -2]),
+                   column(dataset[:, -1]),
+                   state_dim)
+
+    def to_array(self):
+        """
+        Returns:
+            the flat representation of the dataset
+        """
+        return np.column_stack((self.sa, self.reward, self.next_state,
+                                self.absorbing, self.end))
+
+    @property
+    def state(self):
+        return self.sa[:, :self.state_dim]
+
+    @property
+    def action(self):
+        return self.sa[:, self.state_dim:]
+
+    @property
+    def episodes(self):
+        """
+        The EpisodeIndex of the dataset. It is read from disk by load,
+        otherwise it is built from the end-of-episode flags at the first
+        access.
+        """
+        if self._episodes is None:
+            self._episodes = EpisodeIndex.from_end_flags(self.end,
+                                                         self.reward)
+        return self._episodes
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, c).nbytes for c in self.COLUMNS)
+
+    def __len__(self):
+        return self.sa.shape[0]
+
+    def __getitem__(self, idx):
+        """
+        Select a subset of the transitions. Slices return views of the
+        stored arrays.
+        """
+        return TransitionDataset(*[getattr(self, c)[idx]
+                                   for c in self.COLUMNS],
+                                 state_dim=self.state_dim)
+
+    def save(self, path):
+        """
+        Store the dataset in the provided directory. If the directory
+        already contains a dataset, the transitions are appended to it.
+
+        Args:
+            path (str): the directory
+        """
+        with DatasetWriter(path, self.state_dim, self.action_dim,
+                           self.reward_dim, self.sa.dtype) as writer:
+            writer.append(self)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load a dataset stored on disk (see DatasetWriter).
+
+        Args:
+            path (str): the directory
+            mmap_mode (str, 'r'): the columns are memory-mapped with the
+                provided mode (see numpy.memmap), hence the dataset is
+                opened without reading it. If None, they are loaded in
+                memory
+        Returns:
+            the dataset
+        """
+        header = _read_header(path)
+        n_samples = header['n_samples']
+        dtype = np.dtype(header['dtype'])
+        widths = _column_widths(header['state_dim'], header['action_dim'],
+                                header['reward_dim'])
+
+        columns = list()
+        for c in cls.COLUMNS:
+            shape = (n_samples, widths[c])
+            filename = os.path.join(path, c + '.bin')
+            if n_samples == 0:
+                column = np.empty(shape, dtype=dtype)
+            elif mmap_mode is None:
+                column = np.fromfile(filename, dtype=dtype,
+                                     count=n_samples * widths[c])
+                column = column.reshape(shape)
+            else:
+                column = np.memmap(filename, dtype=dtype, mode=mmap_mode,
+                                   shape=shape)
+            if c != 'sa' and widths[c] == 1:
+                column = column[:, 0]
+            columns.append(column)
+
+        dataset = cls(*columns, state_dim=header['state_dim'])
+        if 'n_episodes' in header:
+            ends = np.fromfile(os.path.join(path, EPISODE_ENDS),
+                               dtype=np.int64, count=header['n_episodes'])
+            dataset._episodes = EpisodeIndex(ends, n_samples,
+                                             dataset.reward)
+
+        return dataset
+
+
+class DatasetWriter(object):
+    """
+    Append-only writer of datasets stored on disk.
+    """
+
+    def __init__(self, path, state_dim, action_dim, reward_dim=1,
+                 dtype='float32'):
+        """
+        Constructor. If the directory already contains a dataset, new
+        transitions are appended to it and the provided dimensions must
+        match the stored ones.
+
+        Args:
+            path (str): the directory of the dataset
+            state_dim (int): state dimensionality
+            action_dim (int): action dimensionality
+            reward_dim (int, 1): reward dimensionality
+            dtype (str, 'float32'): type of the stored arrays
+        """
+        self.path = path
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.reward_dim = reward_dim
+        self.dtype = np.dtype(dtype)
+
+        header = {'state_dim': state_dim,
+                  'action_dim': action_dim,
+                  'reward_dim': reward_dim,
+                  'dtype': self.dtype.str,
+                  'n_samples': 0,
+                  'n_episodes': 0}
+        if os.path.exists(os.path.join(path, HEADER)):
+            stored = _read_header(path)
+            for k in ['state_dim', 'action_dim', 'reward_dim', 'dtype']:
+                if stored[k] != header[k]:
+                    raise ValueError('{} of the stored dataset is {}, '
+                                     '{} provided.'.format(k, stored[k],
+                                                           header[k]))
+            self._header = stored
+        else:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            self._header = header
+            _write_header(path, header)
+
+        self._files = dict()
+        for c in TransitionDataset.COLUMNS:
+            f = open(os.path.join(path, c + '.bin'), 'ab')
+            # discard transitions not recorded in the header
+            f.truncate(self._header['n_samples'] * self.dtype.itemsize *
+                       self._widths()[c])
+            self._files[c] = f
+
+        f = open(os.path.join(path, EPISODE_ENDS), 'ab')
+        if 'n_episodes' not in self._header:
+            # datasets written before the episode index was stored
+            end = TransitionDataset.load(path).end
+            f.truncate(0)
+            f.write((np.flatnonzero(end == 1) + 1).astype(np.int64).tobytes())
+            self._header['n_episodes'] = int(np.sum(end == 1))
+        f.truncate(self._header['n_episodes'] * 8)
+        self._episode_ends = f
+
+    def _widths(self):
+        return _column_widths(self.state_dim, self.action_dim,
+                              self.reward_dim)
+
+    @property
+    def n_samples(self):
+        return self._header['n_samples']
+
+    def append(self, data):
+        """
+        Append transitions to the dataset.
+
+        Args:
+            data (numpy.array, TransitionDataset): the transitions, in the
+                flat representation [state, action, reward, next state,
+                absorbing, end] or as a TransitionDataset
+        """
+        if not isinstance(data, TransitionDataset):
+            data = TransitionDataset.from_array(data, self.state_dim,
+                                                self.action_dim,
+                                                self.reward_dim, self.dtype)
+        for c in TransitionDataset.COLUMNS:
+            column = np.ascontiguousarray(getattr(data, c), dtype=self.dtype)
+            self._files[c].write(column.tobytes())
+            self._files[c].flush()
+
+        ends = np.flatnonzero(data.end == 1) + 1 + self._header['n_samples']
+        self._episode_ends.write(ends.astype(np.int64).tobytes())
+        self._episode_ends.flush()
+
+        self._header['n_samples'] += len(data)
+        self._header['n_episodes'] += len(ends)
+        _write_header(self.path, self._header)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._episode_ends.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -11,10 +11,12 @@ else:
 import gym
 import numpy as np
 from ifqi.algorithms.selection.feature_extraction.helpers import crop_state
+from ifqi.evaluation.policies import SharedPolicy
 from ifqi.evaluation.utils import filter_state_with_RFS
 
 from ..envs.utils import get_space_info
-from joblib import Parallel, delayed
+from ..envs.vectorenv import make_vector_env
+from joblib import Parallel, delayed, effective_n_jobs
 
 
 def _eval_and_render(mdp, policy, horizon=None, gamma=None, metric='discounted',
@@ -97,8 +99,9 @@ def _eval_and_render_vectorial(mdp, policy, horizon=None, gamma=None, metric='di
             args = getargspec(mdp.reset)
             npin = len(args.args)
         else:
+            # unlike getargspec, signature does not count self
             sig = signature(mdp.reset)
-            npin = len(sig.parameters )
+            npin = len(sig.parameters) + 1
         if npin > 1:
             state = mdp.reset(initial_states[e, :]
                           if initial_states is not None else None)
@@ -126,41 +129,140 @@ def _eval_and_render_vectorial(mdp, policy, horizon=None, gamma=None, metric='di
     return values, steps
 
 
-def _parallel_eval(mdp, policy, horizon, gamma, metric, initial_states, n_episodes,
-                   n_jobs, n_episodes_per_job):
+def _eval_vectorized(mdp, policy, horizon=None, gamma=None,
+                     metric='discounted', initial_states=None, n_episodes=1):
+    """
+    This function evaluates a policy advancing all the episodes in lockstep
+    in the vectorized environment of mdp (see make_vector_env). The policy
+    is queried once per step with the stacked states of the running
+    episodes, while finished episodes are masked; the statistics are the
+    same of _eval_and_render_vectorial.
+    Params:
+        mdp (object): the environment to solve. Environments without a
+            vectorized implementation are simulated by copies
+        policy (object): a policy object (method draw_action is expected,
+            accepting a matrix of states)
+        metric (string, 'discounted'): the evaluation metric ['discounted',
+            'average']
+        initial_states (np.array, None): initial states to use to evaluate
+            policy. If None the state is choosen by the mdp
+        n_episodes (int): number of episodes to be simulated. It is used
+            only when initial_states is None
+    Return:
+        values (np.array): the selected evaluation metric of each episode
+        steps (np.array): the number of steps of each episode
+    """
     if initial_states is not None:
-        n_episodes = initial_states.shape[0] \
-            if len(initial_states.shape) > 1 else 1
-
-    if hasattr(mdp, 'spec') and mdp.spec is not None:
-        if n_episodes < n_episodes_per_job:
-            how_many = n_episodes
-            n_episodes_per_job = 1
+        if isinstance(initial_states, int):
+            n_episodes = initial_states
+            initial_states = None
         else:
-            how_many = int(ceil(float(n_episodes) / n_episodes_per_job))
-        out = Parallel(
-            n_jobs=2, verbose=2,
-        )(
-            delayed(_eval_and_render_vectorial)(gym.make(mdp.spec.id), policy,
-                                      horizon=horizon,
-                                      gamma=gamma,
-                                      metric=metric,
-                                      initial_states=n_episodes_per_job if initial_states is None else initial_states,
+            initial_states = np.atleast_2d(initial_states)
+            n_episodes = initial_states.shape[0]
+    if hasattr(mdp, 'horizon'):
+        gamma = mdp.gamma
+        horizon = mdp.horizon
+    assert horizon is not None
+    assert gamma is not None
+    if metric == 'average':
+        gamma = 1
+
+    env = make_vector_env(mdp, n_episodes)
+    states = env.reset(initial_states)
+    values = np.zeros(n_episodes)
+    steps = np.zeros(n_episodes)
+    running = np.ones(n_episodes, dtype=bool)
+    df = 1
+    t = 0
+    while t < horizon and np.any(running):
+        idx = np.flatnonzero(running)
+        actions = _draw_actions(policy, states[idx], True)
+        states, r, absorbing, _ = env.step(_scatter(actions, idx, n_episodes))
+        values[idx] += df * r[idx]
+        steps[idx] += 1
+        df *= gamma
+        running = ~absorbing
+        t += 1
+    if metric == 'average':
+        values /= steps
+
+    return values, steps
+
+
+def _draw_actions(policy, states, evaluation):
+    actions = policy.draw_action(states, np.zeros(states.shape[0]),
+                                 evaluation)
+    return np.asarray(actions, dtype=float).reshape(states.shape[0], -1)
+
+
+def _scatter(rows, idx, n):
+    out = np.zeros((n, rows.shape[1]))
+    out[idx] = rows
+    return out
+
+
+def _eval_shard(mdp, policy, horizon, gamma, metric, initial_states,
+                n_episodes, seed=None, vectorize=False):
+    mdp = _make_env(mdp)
+    if seed is not None:
+        np.random.seed(seed)
+        if hasattr(mdp, 'seed'):
+            mdp.seed(seed)
+    if vectorize:
+        return _eval_vectorized(mdp, policy, horizon, gamma, metric,
+                                initial_states, n_episodes)
+    return _eval_and_render_vectorial(mdp, policy, horizon, gamma, metric,
+                                      initial_states, n_episodes,
                                       render=False)
-            for _ in range(how_many))
 
-        values = []
-        steps = []
-        n_episodes = 0
-        for el in out:
-            v, s = el
-            n_episodes += v.shape[0]
-            values.append(v)
-            steps.append(s)
 
+def _parallel_eval(mdp, policy, horizon, gamma, metric, initial_states, n_episodes,
+                   n_jobs, n_episodes_per_job, vectorize=False):
+    """
+    This function evaluates a policy running the episodes in n_jobs
+    processes. Episodes (and initial states) are split in contiguous shards,
+    one for each process; each process builds its own environment and seeds
+    it with a different seed. The policy is serialized once to a
+    memory-mapped file that the processes load (see SharedPolicy).
+    """
+    if initial_states is not None:
+        if isinstance(initial_states, int):
+            n_episodes = initial_states
+            initial_states = None
+        else:
+            initial_states = np.asarray(initial_states)
+            if initial_states.ndim == 1:
+                initial_states = initial_states.reshape(1, -1)
+            n_episodes = initial_states.shape[0]
+
+    n_jobs = min(effective_n_jobs(n_jobs),
+                 int(ceil(float(n_episodes) / n_episodes_per_job)))
+    if n_jobs <= 1:
+        values, steps = _eval_shard(mdp, policy, horizon, gamma, metric,
+                                    initial_states, n_episodes,
+                                    vectorize=vectorize)
     else:
-        values, steps = _eval_and_render_vectorial(mdp, policy, horizon, gamma, metric,
-                                                   initial_states, n_episodes, render=False)
+        if hasattr(mdp, 'spec') and mdp.spec is not None:
+            mdp = mdp.spec.id
+        # the policy is serialized once and loaded by the workers
+        shared = policy if isinstance(policy, SharedPolicy) \
+            else SharedPolicy(policy)
+        seeds = np.random.randint(2 ** 31 - 1, size=n_jobs)
+        shards = np.array_split(np.arange(n_episodes), n_jobs)
+        try:
+            out = Parallel(n_jobs=n_jobs)(
+                delayed(_eval_shard)(mdp, shared, horizon, gamma, metric,
+                                     None if initial_states is None
+                                     else initial_states[shard],
+                                     len(shard), seed, vectorize)
+                for shard, seed in zip(shards, seeds))
+        finally:
+            if shared is not policy:
+                shared.close()
+
+        values = np.concatenate([v for v, _ in out])
+        steps = np.concatenate([s for _, s in out])
+
     return np.mean(values), 2. * np.std(values) / np.sqrt(n_episodes), \
            np.mean(steps), 2. * np.std(steps) / np.sqrt(n_episodes)
 
@@ -216,18 +318,38 @@ def _eval_with_FE(mdp, policy, AE, metric, selected_states=None, max_ep_len=np.i
 
 
 def evaluate_policy(mdp, policy, horizon=None, gamma=None, metric='discounted', initial_states=None,
-                    n_episodes=1, render=False, n_jobs=-1, n_episodes_per_job=10):
+                    n_episodes=1, render=False, n_jobs=1, n_episodes_per_job=10,
+                    vectorize=False):
     """
     This function evaluate a policy on the given environment w.r.t.
     the specified metric by executing multiple episode.
     Params:
-        mdp (object): the environment to solve
-        policy (object): a policy object (method draw_action is expected)
+        mdp (object, str): the environment to solve. It can also be a gym id
+            or a class (or any picklable function) building the environment
+        policy (object): a policy object (method draw_action is expected).
+            Wrap a deterministic policy in a CachedPolicy to reuse its
+            actions across evaluations (with n_jobs=1)
         metric (string, 'discounted'): the evaluation metric ['discounted',
             'average']
         initial_states (np.array, None): initial states to use to evaluate
             policy. If none the state is selected by the mdp
+        n_episodes (int, 1): number of episodes to be simulated. It is used
+            only when initial_states is None
         render (bool, True): whether to render the step of the environment
+        n_jobs (int, 1): the number of processes running the episodes (-1
+            for all the CPUs). The episodes and the initial states are split
+            among the processes, which load the policy from a memory-mapped
+            file, and each process is seeded from numpy.random. Provide a
+            SharedPolicy to serialize the policy once for several
+            evaluations. The default used to be -1, which ran only the
+            environments built by gym.make, in 2 processes: the parallel
+            evaluation now applies to every environment, hence it must be
+            requested
+        n_episodes_per_job (int, 10): the minimum number of episodes of each
+            process
+        vectorize (bool, False): whether to advance all the episodes in
+            lockstep, querying the policy once per step with the states of
+            all the running episodes (see _eval_vectorized)
     Return:
         metric (float): the selected evaluation metric
         confidence (float): 95% confidence level for the provided metric
@@ -236,10 +358,11 @@ def evaluate_policy(mdp, policy, horizon=None, gamma=None, metric='discounted',
     """
     assert metric in ['discounted', 'average', 'cumulative'], "unsupported metric"
     if render:
-        return _eval_and_render(mdp, policy, horizon, gamma, metric, initial_states, True)
+        return _eval_and_render(_make_env(mdp), policy, horizon, gamma, metric,
+                                initial_states, True)
     else:
         return _parallel_eval(mdp, policy, horizon, gamma, metric, initial_states,
-                              n_episodes, n_jobs, n_episodes_per_job)
+                              n_episodes, n_jobs, n_episodes_per_job, vectorize)
 
 
 def evaluate_policy_with_FE(mdp, policy, AE, metric='discounted', n_episodes=1,
@@ -282,25 +405,179 @@ def evaluate_policy_with_FE(mdp, policy, AE, metric='discounted', n_episodes=1,
            steps.mean(), 2 * steps.std() / np.sqrt(n_episodes)
 
 
-def collect_episodes(mdp, policy=None, horizon=None, n_episodes=1, n_jobs=1):
+class _TransitionBuffer(object):
     """
-    if hasattr(mdp, 'spec') and mdp.spec is not None:
-        out = Parallel(n_jobs=n_jobs, verbose=2,)(
-            delayed(collect_episode)(gym.make(mdp.spec.id), policy)
-            for i in range(n_episodes))
-
-        # out is a list of np.array, each one representing an episode
-        # merge the results
-        data = np.concatenate(out, axis=0)
-    else:
-        raise ValueError('collect_episodes must be implemented')
+    Growable buffer storing the transitions in the flat representation
+    [state, action, reward, next state, absorbing, end]. Rows are written in
+    place in a preallocated matrix whose capacity is doubled when it is full.
+    """
+
+    def __init__(self, capacity=1024):
+        self._capacity = max(int(capacity), 1)
+        self._data = None
+        self.n_samples = 0
+
+    def _allocate(self, state, action, reward):
+        state_dim, action_dim, reward_dim = state.size, action.size, \
+            reward.size
+        reward_idx = state_dim + action_dim
+        next_state_idx = reward_idx + reward_dim
+        self._reward_idx = reward_idx
+        self._next_state_idx = next_state_idx
+        self._absorbing_idx = next_state_idx + state_dim
+        self._data = np.empty((self._capacity, self._absorbing_idx + 2))
+
+    def append(self, state, action, reward, next_state, absorbing, end):
+        state = np.ravel(state)
+        action = np.ravel(action)
+        reward = np.ravel(reward)
+        if self._data is None:
+            self._allocate(state, action, reward)
+        elif self.n_samples == self._data.shape[0]:
+            data = np.empty((2 * self._data.shape[0], self._data.shape[1]))
+            data[:self.n_samples] = self._data
+            self._data = data
+
+        row = self._data[self.n_samples]
+        row[:state.size] = state
+        row[state.size:self._reward_idx] = action
+        row[self._reward_idx:self._next_state_idx] = reward
+        row[self._next_state_idx:self._absorbing_idx] = np.ravel(next_state)
+        row[-2] = absorbing
+        row[-1] = end
+        self.n_samples += 1
+
+    def get_data(self):
+        """
+        Returns:
+            the collected transitions. The buffer is copied only when it is
+            not full
+        """
+        if self._data is None:
+            return np.empty((0, 0))
+        if self.n_samples == self._data.shape[0]:
+            return self._data
+        return self._data[:self.n_samples].copy()
+
+
+def _make_env(mdp):
+    """
+    Build the environment described by mdp: a gym id, a class or a function
+    returning the environment, or the environment itself.
+    """
+    if isinstance(mdp, str):
+        return gym.make(mdp)
+    if isinstance(mdp, gym.Env):
+        return mdp
+    if callable(mdp):
+        return mdp()
+    return mdp
+
+
+def _collect_shard(mdp, policy, horizon, n_episodes, seed, vectorize=False):
+    mdp = _make_env(mdp)
+    if seed is not None:
+        np.random.seed(seed)
+        if hasattr(mdp, 'seed'):
+            mdp.seed(seed)
+    if horizon is None:
+        horizon = mdp.horizon
+    if vectorize:
+        return _collect_vectorized(make_vector_env(mdp, n_episodes), policy,
+                                   horizon)
+    buffer = _TransitionBuffer(min(n_episodes * horizon, 2 ** 16))
+    for i in range(n_episodes):
+        _collect_episode(mdp, policy, horizon, buffer)
+
+    return buffer.get_data()
+
+
+def _collect_vectorized(env, policy, horizon):
+    """
+    Collect a dataset simulating env.n_envs episodes at once in the
+    vectorized environment env. Transitions are sorted by episode as in
+    collect_episodes.
+    """
+    from ..utils.spaces.sampler import space_sampler
+    sampler = space_sampler(env.action_space)
+
+    n_episodes = env.n_envs
+    states = env.reset()
+    running = np.ones(n_episodes, dtype=bool)
+    blocks = list()
+    episodes = list()
+    t = 0
+    while t < horizon and np.any(running):
+        idx = np.flatnonzero(running)
+        if policy is not None:
+            actions = _draw_actions(policy, states[idx], False)
+        else:
+            actions = np.array([np.ravel(sampler()) for _ in idx],
+                               dtype=float)
+        next_states, reward, absorbing, _ = env.step(
+            _scatter(actions, idx, n_episodes))
+        end = absorbing[idx] | (t == horizon - 1)
+        blocks.append(np.column_stack((states[idx], actions, reward[idx],
+                                       next_states[idx], absorbing[idx],
+                                       end)))
+        episodes.append(idx)
+        states = next_states
+        running = ~absorbing
+        t += 1
+
+    order = np.argsort(np.concatenate(episodes), kind='mergesort')
+
+    return np.concatenate(blocks)[order]
+
+
+def collect_episodes(mdp, policy=None, horizon=None, n_episodes=1, n_jobs=1,
+                     seed=None, vectorize=False):
+    """
+    This function can be used to collect a dataset running multiple episodes
+    from the environment using a given policy. Transitions are written in a
+    single preallocated buffer (see collect_episode for the format of the
+    dataset).
+
+    Params:
+        mdp (object, str): the environment to solve. It can also be a gym id
+            or a class (or any picklable function) building the environment
+        policy (object, None): an object that can be evaluated in order to get
+            an action
+        horizon (int, None): the maximum length of the episodes. If None,
+            the horizon of the environment is used
+        n_episodes (int, 1): the number of episodes
+        n_jobs (int, 1): the number of processes collecting the episodes.
+            Episodes are split in contiguous shards, one for each process,
+            which builds its own environment (environment instances are
+            copied) and the shards are merged in episode order
+        seed (int, None): the seed of the random generators. Each process
+            is seeded with a different seed derived from it, hence the
+            dataset is reproducible for a given n_jobs. If None, the seeds
+            are drawn from the numpy generator
+        vectorize (bool, False): whether to advance the episodes of each
+            process in lockstep in the vectorized environment of mdp (see
+            make_vector_env). The policy is queried once per step with the
+            states of all the running episodes
+
+    Returns:
+        the dataset
     """
     assert n_episodes > 0
-    data = np.array(collect_episode(mdp, policy, horizon))
-    for i in range(1, n_episodes):
-        data = np.append(data, collect_episode(mdp, policy, horizon), axis=0)
+    n_jobs = min(effective_n_jobs(n_jobs), n_episodes)
+    if n_jobs == 1:
+        return _collect_shard(mdp, policy, horizon, n_episodes, seed,
+                              vectorize)
+
+    random_state = np.random.RandomState(seed) if seed is not None \
+        else np.random
+    seeds = random_state.randint(2 ** 31 - 1, size=n_jobs)
+    shards = np.array_split(np.arange(n_episodes), n_jobs)
+    out = Parallel(n_jobs=n_jobs)(
+        delayed(_collect_shard)(mdp, policy, horizon, len(shard), s,
+                                vectorize)
+        for shard, s in zip(shards, seeds))
 
-    return data
+    return np.concatenate(out, axis=0)
 
 
 def collect_episode(mdp, policy=None, horizon=None):
@@ -323,13 +600,18 @@ def collect_episode(mdp, policy=None, horizon=None):
             - a flag indicating whether the episode is finished (absorbing state
               is reached or the time horizon is met)
     """
-    done = False
-    t = 0
-    data = list()
     if horizon is None:
         horizon = mdp.horizon
+    buffer = _TransitionBuffer(min(horizon, 2 ** 16))
+    _collect_episode(mdp, policy, horizon, buffer)
+
+    return buffer.get_data()
+
+
+def _collect_episode(mdp, policy, horizon, buffer):
+    done = False
+    t = 0
     state = mdp.reset()
-    # state_dim, action_dim, reward_dim = get_space_info(mdp)
 
     from ..utils.spaces.sampler import space_sampler
     sampler = space_sampler(mdp.action_space)
@@ -340,18 +622,11 @@ def collect_episode(mdp, policy=None, horizon=None):
             action = sampler()
         action = np.array([action]).ravel()
         next_state, reward, done, _ = mdp.step(action)
-        new_el = state.tolist() + action.tolist() + [reward] + \
-                 next_state.tolist()
         if not done:
-            if t < horizon - 1:
-                new_el += [0, 0]
-            else:
-                new_el += [0, 1]
+            buffer.append(state, action, reward, next_state, 0,
+                          1 if t == horizon - 1 else 0)
         else:
-            new_el += [1, 1]
+            buffer.append(state, action, reward, next_state, 1, 1)
 
-        data.append(new_el)
         state = next_state
         t += 1
-
-    return np.array(data)
@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+"""
+Wrappers of the policies used in evaluation.
+"""
+
+# policies loaded by this process, by path. The workers of joblib are
+# reused across evaluations, hence only the most recent ones are kept
+_loaded_policies = OrderedDict()
+_max_loaded_policies = 2
+
+
+class SharedPolicy(object):
+    """
+    This class serializes a policy once to a file, with its numpy arrays
+    stored so that they can be memory-mapped. When the wrapper is sent to
+    worker processes (see evaluate_policy), only the path of the file is
+    pickled and each process loads the policy once. The numpy arrays of the
+    policy (e.g. the weights of linear models) are memory-mapped, while
+    objects that copy their arrays when they are unpickled are loaded in the
+    memory of each process: this is the case of the trees of scikit-learn,
+    whose nodes are copied by __setstate__.
+    The wrapper can be reused for several evaluations of the same policy;
+    call close to remove the file.
+    """
+
+    def __init__(self, policy, folder=None, mmap_mode='r'):
+        """
+        Constructor.
+        Args:
+            policy (object): the policy (method draw_action is expected)
+            folder (str, None): the folder of the file. If None, a temporary
+                folder is created
+            mmap_mode (str, 'r'): the mode used by the processes to
+                memory-map the arrays (see joblib.load)
+        """
+        self._folder = tempfile.mkdtemp(prefix='ifqi_policy_', dir=folder)
+        self.path = os.path.join(self._folder, 'policy.pkl')
+        self.mmap_mode = mmap_mode
+
+        start = time.time()
+        joblib.dump(policy, self.path)
+        self.dump_time = time.time() - start
+        self.nbytes = sum(os.path.getsize(os.path.join(self._folder, f))
+                          for f in os.listdir(self._folder))
+
+        self._policy = policy
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_policy'] = None
+        return state
+
+    @property
+    def policy(self):
+        if self._policy is None:
+            if self.path in _loaded_policies:
+                # the policy becomes the most recent
+                self._policy = _loaded_policies.pop(self.path)
+            else:
+                self._policy = joblib.load(self.path,
+                                           mmap_mode=self.mmap_mode)
+            _loaded_policies[self.path] = self._policy
+            while len(_loaded_policies) > _max_loaded_policies:
+                _loaded_policies.popitem(last=False)
+        return self._policy
+
+    def draw_action(self, states, absorbing, evaluation=False):
+        return self.policy.draw_action(states, absorbing, evaluation)
+
+    def close(self):
+        """
+        Remove the file of the policy.
+        """
+        shutil.rmtree(self._folder, ignore_errors=True)
+
+
+class CachedPolicy(object):
+    """
+    This class memoizes the actions drawn by a deterministic policy during
+    evaluation, so that states visited again (e.g. the first steps of the
+    episodes starting from the same initial states, evaluated with different
+    metrics) do not require a new query of the policy. States are quantized
+    to a grid before being used as keys, hence states closer than the
+    resolution share the same action. The cache is bounded and the least
+    recently used states are evicted first.
+    Only the calls with evaluation=True are cached, the others are forwarded
+    to the policy. The cache lives in the process using the wrapper: to reuse
+    it across calls to evaluate_policy, evaluate with n_jobs=1.
+    """
+
+    def __init__(self, policy, resolution=None, max_size=100000):
+        """
+        Constructor.
+        Args:
+            policy (object): the policy (method draw_action is expected)
+            resolution (float, numpy.array, None): the size of the cells of
+                the grid used to quantize the states, for all the state
+                dimensions or for each of them. If None, only identical
+                states share the same action
+            max_size (int, 100000): the maximum number of stored states
+        """
+        self.policy = policy
+        self.resolution = None if resolution is None \
+            else np.asarray(resolution, dtype=float)
+        self.max_size = max_size
+
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # shapes of the actions returned by the policy for a single state
+        # and for each row of a batch
+        self._action_shape = (1, -1)
+        self._row_shape = (-1,)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        """
+        Remove the stored actions and reset the statistics.
+        """
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _keys(self, states):
+        states = np.asarray(states, dtype=float)
+        if self.resolution is not None:
+            states = np.floor(states / self.resolution + .5).astype(np.int64)
+        return [row.tobytes() for row in states]
+
+    def _get(self, key):
+        # the entry is moved to the end, i.e. it becomes the most recent
+        action = self._cache.pop(key)
+        self._cache[key] = action
+        return action.copy()
+
+    def _put(self, key, action):
+        # actions are stored flat, since single states and batches share
+        # the entries
+        self._cache[key] = np.ravel(action).copy()
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+    def draw_action(self, states, absorbing, evaluation=False):
+        """
+        Compute the actions of the provided states, querying the policy
+        only for the states that are not stored.
+        Args:
+            states (numpy.array): a state or a matrix of states.
+                Dimensions: (state_dim) or (nsamples x state_dim)
+            absorbing (bool, numpy.array): the absorbing flags of the states
+            evaluation (bool, False): true if this function is called during
+                policy evaluation. Otherwise the cache is not used
+        Returns:
+            the actions, with the shape returned by the policy. The stored
+            actions are copied
+        """
+        if not evaluation:
+            return self.policy.draw_action(states, absorbing, evaluation)
+
+        states = np.asarray(states)
+        if states.ndim < 2:
+            key = self._keys(states.reshape(1, -1))[0]
+            if key in self._cache:
+                self.hits += 1
+                return self._get(key).reshape(self._action_shape)
+            self.misses += 1
+            action = self.policy.draw_action(states, absorbing, evaluation)
+            self._action_shape = np.shape(action)
+            self._put(key, action)
+            return action
+
+        keys = self._keys(states)
+        actions = [None] * len(keys)
+        missing = list()
+        for i, key in enumerate(keys):
+            if key in self._cache:
+                actions[i] = self._get(key)
+            else:
+                missing.append(i)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if len(missing) > 0:
+            # repeated states are queried once
+            rows = OrderedDict()
+            for i in missing:
+                rows.setdefault(keys[i], i)
+            rows = list(rows.values())
+            if np.ndim(absorbing) > 0:
+                absorbing = np.asarray(absorbing).reshape(-1)[rows]
+            drawn = np.asarray(self.policy.draw_action(states[rows],
+                                                       absorbing, evaluation))
+            self._row_shape = drawn.shape[1:]
+            drawn = dict((keys[i], np.ravel(a)) for i, a in zip(rows, drawn))
+            for i in missing:
+                actions[i] = drawn[keys[i]]
+            for key, action in drawn.items():
+                self._put(key, action)
+
+        return np.array(actions).reshape((len(keys),) + self._row_shape)
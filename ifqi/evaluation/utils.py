@@ -1,27 +1,166 @@
 from __future__ import print_function
 import numpy as np
 
+from ifqi.evaluation.dataset import EpisodeIndex, TransitionDataset
+
+
+def _columns(data, state_dim, action_dim, reward_dim):
+    """
+    Returns:
+        the states, the next states and the end-of-episode flags of the
+        flat or columnar dataset, without copies
+    """
+    if isinstance(data, TransitionDataset):
+        assert data.state_dim == state_dim and \
+            data.action_dim == action_dim and \
+            data.reward_dim == reward_dim
+        return data.state, data.next_state, data.end
 
-def check_dataset(data, state_dim, action_dim, reward_dim):
     n_columns = 2 * state_dim + action_dim + reward_dim + 2
     assert data.shape[1] == n_columns, \
         '{} != {}'.format(data.shape[1], n_columns)
 
-    state_mask = np.zeros(n_columns, dtype=bool)
-    state_mask[:state_dim] = True
-    nextstate_mask = np.zeros(n_columns, dtype=bool)
     nextstate_idx = state_dim + action_dim + reward_dim
-    nextstate_mask[nextstate_idx:nextstate_idx + state_dim] = True
+    return data[:, :state_dim], \
+        data[:, nextstate_idx:nextstate_idx + state_dim], data[:, -1]
+
+
+def find_invalid_transitions(data, state_dim, action_dim, reward_dim,
+                             check_finite=False, chunk_size=65536):
+    """
+    Find the transitions whose next state is not the state of the following
+    transition, while the episode does not end. Rows are compared as
+    np.allclose does, a chunk of rows at a time, hence the dataset is read
+    once without building large temporary arrays.
+
+    Args:
+        data (numpy.array, TransitionDataset): the dataset, in the flat
+            representation [state, action, reward, next state, absorbing,
+            end] or as a TransitionDataset
+        state_dim (int): state dimensionality
+        action_dim (int): action dimensionality
+        reward_dim (int): reward dimensionality
+        check_finite (bool, False): whether to find the transitions
+            containing NaN or infinite values as well
+        chunk_size (int, 65536): the number of rows compared at once
+    Returns:
+        the indices of the discontinuous transitions and the indices of the
+        transitions containing non-finite values (empty if check_finite is
+        false)
+    """
+    state, next_state, end = _columns(data, state_dim, action_dim,
+                                      reward_dim)
+    n_samples = state.shape[0]
+
+    discontinuous, nonfinite = list(), list()
+    for start in range(0, n_samples, chunk_size):
+        stop = min(start + chunk_size, n_samples)
+        # transition i is compared with the state of transition i + 1
+        last = min(stop, n_samples - 1)
+        if last > start:
+            snext = next_state[start:last]
+            s = state[start + 1:last + 1]
+            mismatch = ~np.all(np.isclose(s, snext), axis=1)
+            mismatch &= end[start:last] != 1
+            discontinuous.append(start + np.flatnonzero(mismatch))
+
+        if check_finite:
+            if isinstance(data, TransitionDataset):
+                finite = np.ones(stop - start, dtype=bool)
+                for c in TransitionDataset.COLUMNS:
+                    column = getattr(data, c)[start:stop]
+                    finite &= np.isfinite(column.reshape(stop - start, -1)) \
+                        .all(axis=1)
+            else:
+                finite = np.isfinite(data[start:stop]).all(axis=1)
+            nonfinite.append(start + np.flatnonzero(~finite))
+
+    def indices(chunks):
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=int)
+
+    return indices(discontinuous), indices(nonfinite)
+
+
+def check_dataset(data, state_dim, action_dim, reward_dim,
+                  check_finite=False):
+    """
+    Check that consecutive transitions of the same episode are continuous
+    (see find_invalid_transitions).
+
+    Args:
+        data (numpy.array, TransitionDataset): the dataset
+        state_dim (int): state dimensionality
+        action_dim (int): action dimensionality
+        reward_dim (int): reward dimensionality
+        check_finite (bool, False): whether to check that all the values are
+            finite
+    Raises:
+        AssertionError: reporting the first offending transitions
+    """
+    discontinuous, nonfinite = find_invalid_transitions(
+        data, state_dim, action_dim, reward_dim, check_finite)
 
-    for i in range(data.shape[0] - 1):
-        snext = data[i, nextstate_mask]
-        end_ep = data[i, -1]
-        s = data[i + 1, state_mask]
-        assert np.allclose(s, snext) or end_ep == 1, \
-            '{} != {}'.format(s, snext)
+    state, next_state, _ = _columns(data, state_dim, action_dim, reward_dim)
+    assert discontinuous.size == 0, \
+        '{} discontinuous transitions, rows {}: {} != {}'.format(
+            discontinuous.size, discontinuous[:10],
+            state[discontinuous[0] + 1], next_state[discontinuous[0]])
+    assert nonfinite.size == 0, \
+        '{} transitions with non-finite values, rows {}'.format(
+            nonfinite.size, nonfinite[:10])
 
 
-def split_dataset(dataset, state_dim, action_dim, reward_dim, last=None):
+def select_episodes(dataset, episodes):
+    """
+    Select some episodes of a dataset.
+
+    Args:
+        dataset (numpy.array, TransitionDataset): the dataset
+        episodes (int, numpy.array): the number of episodes at the beginning
+            of the dataset, or the indices of the episodes (possibly
+            repeated, e.g. drawn by EpisodeIndex.sample). The episode index
+            of a TransitionDataset is reused, while the one of a flat
+            dataset is built from its end-of-episode flags
+    Returns:
+        the transitions of the episodes. The first episodes are a view of
+        the dataset
+    """
+    if isinstance(dataset, TransitionDataset):
+        index = dataset.episodes
+    else:
+        index = EpisodeIndex.from_end_flags(dataset[:, -1])
+
+    if np.ndim(episodes) == 0:
+        return dataset[:index.prefix(episodes)]
+    return dataset[index.rows(episodes)]
+
+
+def split_dataset(dataset, state_dim, action_dim, reward_dim, last=None,
+                  episodes=None):
+    """
+    Split the dataset in its columns.
+
+    Args:
+        dataset (numpy.array, TransitionDataset): the dataset
+        state_dim (int): state dimensionality
+        action_dim (int): action dimensionality
+        reward_dim (int): reward dimensionality
+        last (int, None): the number of transitions to be used. If None,
+            all of them are used
+        episodes (int, numpy.array, None): the episodes to be used (see
+            select_episodes). If None, they are selected by last
+    Returns:
+        the states, the actions, the rewards, the next states and the
+        absorbing flags
+    """
+    if episodes is not None:
+        dataset = select_episodes(dataset, episodes)
+
+    if isinstance(dataset, TransitionDataset):
+        dataset = dataset[:last]
+        return dataset.state, dataset.action, dataset.reward, \
+            dataset.next_state, dataset.absorbing
+
     nextstate_idx = state_dim + action_dim + reward_dim
     reward_idx = action_dim + state_dim
     state = dataset[:last, 0:state_dim]
@@ -32,7 +171,40 @@ def split_dataset(dataset, state_dim, action_dim, reward_dim, last=None):
     return state, actions, reward, next_states, absorbing
 
 
-def split_data_for_fqi(dataset, state_dim, action_dim, reward_dim, last=None):
+def split_data_for_fqi(dataset, state_dim, action_dim, reward_dim, last=None,
+                       view=False, episodes=None):
+    """
+    Split the dataset in the input and the output of FQI.
+
+    Args:
+        dataset (numpy.array, TransitionDataset): the dataset
+        state_dim (int): state dimensionality
+        action_dim (int): action dimensionality
+        reward_dim (int): reward dimensionality
+        last (int, None): the number of transitions to be used. If None,
+            all of them are used
+        view (bool, False): if True, a flat dataset is not copied: the input
+            is returned as a TransitionDataset referencing its columns (see
+            TransitionDataset.from_array), hence splitting several prefixes
+            of the same dataset does not allocate memory
+        episodes (int, numpy.array, None): the episodes to be used (see
+            select_episodes). If None, they are selected by last
+    Returns:
+        sast (the matrix [state, action, next state, absorbing] or a
+        TransitionDataset) and the rewards
+    """
+    if episodes is not None:
+        dataset = select_episodes(dataset, episodes)
+
+    if view and not isinstance(dataset, TransitionDataset):
+        dataset = TransitionDataset.from_array(dataset, state_dim, action_dim,
+                                               reward_dim, copy=False)
+
+    if isinstance(dataset, TransitionDataset):
+        # FQI accepts the dataset itself as sast
+        dataset = dataset[:last]
+        return dataset, dataset.reward
+
     reward_idx = state_dim + action_dim
     sast = np.append(dataset[:last, :reward_idx],
                      dataset[:last, reward_idx + reward_dim:-1],
@@ -1,5 +1,7 @@
 from .actionregressor import ActionRegressor
+from .compiled import CompiledForest, compile_model
 from .ensemble import Ensemble
 from .regressor import Regressor
 
-__all__ = ['ActionRegressor', 'Ensemble', 'Regressor']
+__all__ = ['ActionRegressor', 'CompiledForest', 'Ensemble', 'Regressor',
+           'compile_model']
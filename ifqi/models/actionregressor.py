@@ -1,11 +1,22 @@
 from builtins import range
 from copy import deepcopy
+import weakref
 
 import numpy as np
+from joblib import Parallel, delayed
 
 from ifqi.models.ensemble import Ensemble
 
 
+def _fit(model, X, y, idxs, action_dim, **kwargs):
+    model.fit(X[idxs, :-action_dim], y[idxs], **kwargs)
+    return model
+
+
+def _predict(model, x, **kwargs):
+    return model.predict(x, **kwargs)
+
+
 class ActionRegressor(object):
     """
     This class is a meta-regressor to be used when the actions are discrete.
@@ -13,9 +24,15 @@ class ActionRegressor(object):
     This is useful when discrete actions are used because the action space
     in this scenario may not be a metric space so it is not necessary to
     exploit spatial correlation along action space.
+    The rows associated to each action are computed once for each input
+    array and reused while the same array is provided again (e.g. the
+    dataset at every FQI iteration): the array must not be modified in
+    place between calls. The number of reused partitions is stored in
+    cache_hits.
     """
 
-    def __init__(self, model, discrete_actions, tol):
+    def __init__(self, model, discrete_actions, tol, n_jobs=1,
+                 prefer='threads'):
         """
         Initialization of the class.
 
@@ -26,6 +43,10 @@ class ActionRegressor(object):
                 [0, 1, 2, discrete_actions - 1]. Otherwise the values
                 contained in the list are used.
             tol (float): tolerance used for comparisons
+            n_jobs (int, 1): number of jobs used to evaluate the models of
+                the different actions concurrently
+            prefer (str, 'threads'): 'threads' for estimators releasing the
+                GIL (e.g. scikit-learn trees), 'processes' otherwise
         """
         if isinstance(discrete_actions, (int, float)):
             discrete_actions = np.arange(int(discrete_actions))
@@ -56,6 +77,14 @@ class ActionRegressor(object):
         self.action_dim = self._actions.shape[1]
 
         self.tol = tol
+        self.n_jobs = n_jobs
+        self.prefer = prefer
+
+        # actions sorted along the first dimension (for the nearest action
+        # lookup)
+        self._action_order = np.argsort(self._actions[:, 0], kind='mergesort')
+        self._partitions = dict()
+        self.cache_hits = 0
 
     def fit(self, X, y, **kwargs):
         """
@@ -68,18 +97,34 @@ class ActionRegressor(object):
             y (np.array): Target values. Dimensions: n_samples x 1
             **kwargs: additional parameters to be passed to the fit function of
                       the estimator
+
+        When n_jobs is not 1, the models of the different actions are fitted
+        concurrently.
         """
         # Save sample wieght if present
-        sample_weight = kwargs.get('sample_weight', None)
+        sample_weight = kwargs.pop('sample_weight', None)
 
-        for i in range(len(self._models)):
-            action = self._actions[i]
-            filter = (np.abs(X[:, -self.action_dim:] - action) <= self.tol)
-            idxs = np.all(filter, axis=1)
+        jobs = list()
+        for i, idxs in enumerate(self._partition(X)):
+            fit_kwargs = dict(kwargs)
             # Keep only sample weights assoccaited to the correct action
             if sample_weight is not None:
-                kwargs['sample_weight'] = sample_weight[idxs]
-            self._models[i].fit(X[idxs, :-self.action_dim], y[idxs], **kwargs)
+                fit_kwargs['sample_weight'] = sample_weight[idxs]
+            jobs.append((i, idxs, fit_kwargs))
+
+        if self.n_jobs == 1:
+            for i, idxs, fit_kwargs in jobs:
+                self._models[i].fit(X[idxs, :-self.action_dim], y[idxs],
+                                    **fit_kwargs)
+        else:
+            # X and y are shared with the workers: threads access them
+            # directly, while joblib memory-maps them for processes
+            models = Parallel(n_jobs=self.n_jobs, prefer=self.prefer)(
+                delayed(_fit)(self._models[i], X, y, idxs, self.action_dim,
+                              **fit_kwargs)
+                for i, idxs, fit_kwargs in jobs)
+            for (i, _, _), model in zip(jobs, models):
+                self._models[i] = model
 
     def predict(self, x, **kwargs):
         """
@@ -98,25 +143,109 @@ class ActionRegressor(object):
             output (np.array): target associated to sample x
         """
         predictions = np.zeros(x.shape[0])
-        for i in range(self._actions.shape[0]):
-            action = self._actions[i]
-            filter = (np.abs(x[:, -self.action_dim:] - action) <= self.tol)
-            idxs = np.all(filter, axis=1)
+        masks = [(i, idxs) for i, idxs in enumerate(self._partition(x))
+                 if idxs.size > 0]
 
-            if np.any(idxs):
-                p = self._models[i].predict(x[idxs, :-self.action_dim], **kwargs)
+        if self.n_jobs == 1 or len(masks) < 2:
+            for i, idxs in masks:
+                predictions[idxs] = self._models[i].predict(
+                    x[idxs, :-self.action_dim], **kwargs)
+        else:
+            out = Parallel(n_jobs=self.n_jobs, prefer=self.prefer)(
+                delayed(_predict)(self._models[i],
+                                  x[idxs, :-self.action_dim], **kwargs)
+                for i, idxs in masks)
+            for (i, idxs), p in zip(masks, out):
                 predictions[idxs] = p
 
         return predictions
 
+    def _partition(self, X):
+        """
+        Compute the rows of X associated to each discrete action. Partitions
+        are cached by array identity, hence the same array is split only
+        once.
+
+        Parameters:
+            X (np.array): samples. Last columns must contain the action.
+                          Dimensions: n_samples x n_features
+        Returns:
+            partition (list): for each action, the sorted array of the
+                indices of the rows containing that action
+        """
+        entry = self._partitions.get(id(X))
+        if entry is not None and entry[0]() is X:
+            self.cache_hits += 1
+            return entry[1]
+
+        labels = self._nearest_actions(X[:, -self.action_dim:])
+        order = np.argsort(labels, kind='mergesort')
+        bounds = np.cumsum(np.bincount(labels + 1,
+                                       minlength=len(self._models) + 1))
+        # the first group contains the rows not matching any action
+        partition = np.split(order, bounds[:-1])[1:]
+
+        # forget the partitions of arrays that do not exist anymore
+        self._partitions = dict((k, v) for k, v in self._partitions.items()
+                                if v[0]() is not None)
+        try:
+            self._partitions[id(X)] = (weakref.ref(X), partition)
+        except TypeError:
+            pass
+
+        return partition
+
+    def _nearest_actions(self, actions):
+        """
+        Find the discrete action closest to each of the provided actions.
+
+        Parameters:
+            actions (np.array): actions to be matched.
+                                Dimensions: n_samples x action_dim
+        Returns:
+            labels (np.array): the index of the closest discrete action for
+                each sample, -1 when no action is within tolerance
+        """
+        if self.action_dim == 1:
+            values = actions[:, 0]
+            sorted_actions = self._actions[self._action_order, 0]
+            pos = np.searchsorted(sorted_actions, values)
+            pos = np.clip(pos, 1, max(len(sorted_actions) - 1, 1))
+            left = sorted_actions[pos - 1]
+            right = sorted_actions[np.minimum(pos, len(sorted_actions) - 1)]
+            pos -= np.abs(values - left) <= np.abs(right - values)
+            nearest = self._action_order[pos]
+            distance = np.abs(values - self._actions[nearest, 0])
+        else:
+            d = np.max(np.abs(actions[:, np.newaxis, :] -
+                              self._actions[np.newaxis, :, :]), axis=2)
+            nearest = np.argmin(d, axis=1)
+            distance = d[np.arange(nearest.shape[0]), nearest]
+
+        return np.where(distance <= self.tol, nearest, -1)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_partitions'] = dict()
+        return state
+
     def adapt(self, iteration):
         if hasattr(self._models[0], 'adapt'):
             for model in self._models:
                 model.adapt(iteration)
 
+    def set_warm_start(self, warm_start):
+        for model in self._models:
+            if hasattr(model, 'set_warm_start'):
+                model.set_warm_start(warm_start)
+
     def has_ensembles(self):
         return isinstance(self._models[0], Ensemble)
 
+    @property
+    def n_stages(self):
+        return self._models[0].n_stages
+
     def _init_model(self, model):
         """
         Initialize a new estimator for each discrete action.
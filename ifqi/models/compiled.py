@@ -0,0 +1,286 @@
+import numpy as np
+
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.ensemble import Ensemble
+from ifqi.models.regressor import Regressor
+
+"""
+Compiled tree ensembles.
+The trees of a trained model (the forests of a Regressor, the stages of an
+Ensemble and the models of the actions of an ActionRegressor) are copied in
+a single set of node arrays, so that all of them are traversed at once with
+array operations instead of calling the predict function of every tree.
+"""
+
+
+def _sklearn_trees(estimator):
+    """
+    Returns:
+        the trees of a scikit-learn regressor and the weight of each of
+        them in the prediction
+    """
+    if hasattr(estimator, 'tree_'):
+        return [estimator.tree_], 1.
+    if hasattr(estimator, 'estimators_') and \
+            not hasattr(estimator, 'learning_rate'):
+        # forests average the predictions of the trees
+        trees = [e.tree_ for e in estimator.estimators_]
+        return trees, 1. / len(trees)
+    raise ValueError('{} is not a tree or a forest.'.format(
+        type(estimator).__name__))
+
+
+def _model_trees(model):
+    """
+    Collect the trees of a model predicting a single output.
+    Args:
+        model (object): a Regressor, an Ensemble of Regressors or a
+            scikit-learn tree or forest
+    Returns:
+        the list of the trees, the list of their weights and the constant
+        added to the prediction
+    """
+    if isinstance(model, Ensemble):
+        trees, weights, bias = list(), list(), 0.
+        for stage in model._models:
+            t, w, b = _model_trees(stage)
+            trees += t
+            weights += w
+            bias += b
+        return trees, weights, bias
+
+    scale, bias = 1., 0.
+    if isinstance(model, Regressor):
+        if model.features or model._input_scaled:
+            raise ValueError('Models with input features or input scaling '
+                             'cannot be compiled.')
+        if model._output_scaled:
+            scale = float(np.ravel(model._pre_y.scale_)[0])
+            bias = float(np.ravel(model._pre_y.mean_)[0])
+        model = model._regressor
+
+    trees, weight = _sklearn_trees(model)
+    for tree in trees:
+        if tree.n_outputs != 1:
+            raise ValueError('Only trees with a single output can be '
+                             'compiled.')
+    return trees, [weight * scale] * len(trees), bias
+
+
+def compile_model(model):
+    """
+    Compile the trees of a trained model.
+    Args:
+        model (object): an ActionRegressor, an Ensemble, a Regressor or a
+            scikit-learn tree or forest
+    Returns:
+        the CompiledForest computing the same predictions
+    """
+    if isinstance(model, ActionRegressor):
+        outputs = [_model_trees(m) for m in model._models]
+        actions, tol = model._actions, model.tol
+    else:
+        outputs = [_model_trees(model)]
+        actions, tol = None, None
+
+    n_trees = sum(len(trees) for trees, _, _ in outputs)
+    weights = np.zeros((n_trees, len(outputs)))
+    feature, threshold, children, value, roots = [], [], [], [], []
+    n_nodes, t = 0, 0
+    for output, (trees, w, _) in enumerate(outputs):
+        for tree, tree_weight in zip(trees, w):
+            leaf = tree.children_left < 0
+            nodes = np.arange(tree.node_count)
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            # children are numbered within the whole set of nodes
+            children.append(np.column_stack(
+                (np.where(leaf, nodes, tree.children_left),
+                 np.where(leaf, nodes, tree.children_right))) + n_nodes)
+            value.append(tree.value[:, 0, 0])
+            roots.append(n_nodes)
+            weights[t, output] = tree_weight
+            n_nodes += tree.node_count
+            t += 1
+
+    return CompiledForest(np.concatenate(feature).astype(np.intp),
+                          np.concatenate(threshold).astype(np.float64),
+                          np.concatenate(children).astype(np.intp),
+                          np.concatenate(value).astype(np.float64),
+                          np.array(roots, dtype=np.intp),
+                          weights,
+                          np.array([b for _, _, b in outputs]),
+                          actions, tol)
+
+
+class CompiledForest(object):
+    """
+    This class evaluates a set of regression trees stored in flat node
+    arrays: for each node, the index of the tested feature, the threshold,
+    the indices of the children and the value. A sample moves to the second
+    child when its feature is greater than the threshold. Leaves test an
+    infinite threshold and are their own children, hence the samples that
+    reached a leaf can be moved without changing their node.
+    The prediction of each output is the weighted sum of the values of the
+    leaves reached in the trees plus a constant.
+    The models of the discrete actions of an ActionRegressor are compiled
+    as different outputs, hence the Q-function of every action is computed
+    with a single traversal of the states (see predict_q). A compiled model
+    only makes predictions: build it with compile_model once the model is
+    trained.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, weights,
+                 bias, actions=None, tol=None, batch_size=None):
+        """
+        Constructor.
+        Args:
+            feature (numpy.array): the feature of each node
+            threshold (numpy.array): the threshold of each node
+            children (numpy.array): the children of each node.
+                Dimensions: (n_nodes x 2)
+            value (numpy.array): the value of each node
+            roots (numpy.array): the root node of each tree
+            weights (numpy.array): the weight of each tree in each output.
+                Dimensions: (n_trees x n_outputs)
+            bias (numpy.array): the constant of each output
+            actions (numpy.array, None): the discrete action associated to
+                each output, if the outputs are the models of the actions of
+                an ActionRegressor. Dimensions: (n_outputs x action_dim)
+            tol (float, None): tolerance used to compare the actions
+            batch_size (int, None): maximum number of samples traversed at
+                once. If None, it is chosen so that about 2^20 nodes are
+                visited at once
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.weights = weights
+        self.bias = bias
+        self.actions = actions
+        self.tol = tol
+        self.batch_size = batch_size
+
+        self._leaf = children[:, 0] == np.arange(children.shape[0])
+
+    @property
+    def n_trees(self):
+        return self.roots.shape[0]
+
+    @property
+    def n_nodes(self):
+        return self.feature.shape[0]
+
+    def predict_outputs(self, X):
+        """
+        Compute every output in the provided samples.
+        Args:
+            X (numpy.array): samples. Dimensions: (n_samples x n_features)
+        Returns:
+            the outputs. Dimensions: (n_samples x n_outputs)
+        """
+        # scikit-learn compares the features in single precision
+        X = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+        batch_size = self.batch_size or max(1, 2 ** 20 // self.n_trees)
+
+        out = np.empty((X.shape[0], self.weights.shape[1]))
+        for start in range(0, X.shape[0], batch_size):
+            batch = X[start:start + batch_size]
+            leaves = self._leaves(batch).reshape(batch.shape[0], self.n_trees)
+            out[start:start + batch.shape[0]] = \
+                self.value[leaves].dot(self.weights) + self.bias
+
+        return out
+
+    def _leaves(self, X):
+        """
+        Returns:
+            the leaf reached by each sample in each tree.
+            Dimensions: (n_samples * n_trees)
+        """
+        n_samples, n_features = X.shape
+        offsets = np.repeat(np.arange(n_samples) * n_features, self.n_trees)
+        nodes = np.tile(self.roots, n_samples)
+        X = X.ravel()
+        children = self.children.ravel()
+
+        active = np.arange(nodes.shape[0])
+        depth = 0
+        while active.size > 0:
+            node = nodes[active]
+            right = X[offsets[active] + self.feature[node]] > \
+                self.threshold[node]
+            node = children[2 * node + right]
+            nodes[active] = node
+            depth += 1
+            # the samples that reached a leaf are removed every few levels
+            if depth % 4 == 0:
+                active = active[~self._leaf[node]]
+
+        return nodes
+
+    def predict(self, x, **kwargs):
+        """
+        Predict the target of the provided samples, as the compiled model.
+        When the model is an ActionRegressor, the last columns of x contain
+        the actions and the samples whose action is unknown are predicted as
+        zero.
+        Args:
+            x (numpy.array): samples. Dimensions: (n_samples x n_features)
+        Returns:
+            the predictions. Dimensions: (n_samples)
+        """
+        if self.actions is None:
+            return self.predict_outputs(x)[:, 0]
+
+        action_dim = self.actions.shape[1]
+        outputs = self._action_outputs(x[:, -action_dim:])
+        predictions = np.zeros(x.shape[0])
+        known = outputs >= 0
+        if np.any(known):
+            q = self.predict_outputs(x[known, :-action_dim])
+            predictions[known] = q[np.arange(q.shape[0]), outputs[known]]
+
+        return predictions
+
+    def predict_q(self, states, actions, **kwargs):
+        """
+        Compute the Q-function of every discrete action in the provided
+        states.
+        Args:
+            states (numpy.array): the states. Dimensions: (n_states x
+                state_dim)
+            actions (numpy.array): the discrete actions.
+                Dimensions: (n_actions x action_dim)
+        Returns:
+            the matrix of Q-values. Dimensions: (n_states x n_actions)
+        """
+        n_states, n_actions = states.shape[0], actions.shape[0]
+        if self.actions is None:
+            samples = np.column_stack(
+                (np.repeat(states, n_actions, axis=0),
+                 np.tile(actions, (n_states, 1))))
+            return self.predict_outputs(samples).reshape(n_states, n_actions)
+
+        outputs = self._action_outputs(actions)
+        q = self.predict_outputs(states)
+        Q = np.zeros((n_states, n_actions))
+        known = outputs >= 0
+        Q[:, known] = q[:, outputs[known]]
+
+        return Q
+
+    def _action_outputs(self, actions):
+        """
+        Returns:
+            the output of the compiled action closest to each action, -1
+            when no action is within tolerance (see ActionRegressor)
+        """
+        actions = np.asarray(actions).reshape(-1, self.actions.shape[1])
+        distance = np.max(np.abs(actions[:, np.newaxis, :] -
+                                 self.actions[np.newaxis, :, :]), axis=2)
+        nearest = np.argmin(distance, axis=1)
+        return np.where(distance[np.arange(nearest.shape[0]), nearest] <=
+                        self.tol, nearest, -1)
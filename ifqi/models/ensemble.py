@@ -28,16 +28,10 @@ class Ensemble(object):
         self._target_sum += self._models[-1].predict(X).ravel()
 
     def predict(self, x, **kwargs):
-        if 'action_idx' in kwargs:
-            action_idx = kwargs['action_idx']
-            n_actions = kwargs['n_actions']
-            if not hasattr(self, '_predict_sum'):
-                self._predict_sum = np.zeros((x.shape[0], n_actions))
-
-            predictions = self._models[-1].predict(x).ravel()
-            self._predict_sum[:, action_idx] += predictions
-
-            return self._predict_sum[:, action_idx]
+        stage = kwargs.get('stage', None)
+        if stage is not None:
+            # prediction of a single stage of the ensemble
+            return self._models[stage].predict(x).ravel()
 
         prediction = np.zeros(x.shape[0])
         for model in self._models:
@@ -48,6 +42,10 @@ class Ensemble(object):
     def adapt(self, iteration):
         self._models.append(self._generate_model(iteration))
 
+    @property
+    def n_stages(self):
+        return len(self._models)
+
     def _init_model(self):
         model = self._generate_model(0)
 
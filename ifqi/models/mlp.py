@@ -30,8 +30,12 @@ class MLP(object):
         self.activation = activation
         self.regularizer = regularizer
         self.model = self.init_model()
+        self.warm_start = True
+        self._initial_weights = self.model.get_weights()
 
     def fit(self, X, y, **kwargs):
+        if not self.warm_start:
+            self.model.set_weights(self._initial_weights)
         self.model.fit(X, y, **kwargs)
 
     def predict(self, x, **kwargs):
@@ -41,6 +45,13 @@ class MLP(object):
     def adapt(self, iteration):
         pass
 
+    def set_warm_start(self, warm_start):
+        """
+        If warm_start is false, the network is trained starting from its
+        initial weights at each fit, otherwise from the current ones.
+        """
+        self.warm_start = warm_start
+
     def init_model(self):
         model = Sequential()
         model.add(Dense(self.hidden_neurons[0],
@@ -41,6 +41,19 @@ class Regressor(object):
 
         return y
 
+    def set_warm_start(self, warm_start):
+        """
+        Enable or disable the reuse of the current solution as the starting
+        point of the next fit.
+        Tree ensembles (e.g. ExtraTreesRegressor) are always refitted from
+        scratch, since their warm start only adds trees to the forest.
+        """
+        if hasattr(self._regressor, 'set_warm_start'):
+            self._regressor.set_warm_start(warm_start)
+        elif hasattr(self._regressor, 'warm_start') and \
+                not hasattr(self._regressor, 'n_estimators'):
+            self._regressor.warm_start = warm_start
+
     def get_weights(self):
         return self._regressor.get_weights()
 
@@ -0,0 +1,65 @@
+from __future__ import print_function
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.regressor import Regressor
+
+
+def build_dataset(discrete_actions, n_samples=300, state_dim=2):
+    np.random.seed(3)
+    states = np.random.randn(n_samples, state_dim)
+    actions = np.random.choice(discrete_actions, (n_samples, 1))
+    X = np.column_stack((states, actions))
+    y = np.sin(states[:, 0]) + actions.ravel()
+
+    return X, y
+
+
+def test_parallel_fit():
+    discrete_actions = [-1., 0., 1.]
+    X, y = build_dataset(discrete_actions)
+    sample_weight = np.random.rand(X.shape[0])
+
+    predictions = list()
+    for n_jobs, prefer in [(1, 'threads'), (2, 'threads'),
+                           (2, 'processes')]:
+        ar = ActionRegressor(Regressor(ExtraTreesRegressor, n_estimators=5,
+                                       random_state=0),
+                             discrete_actions, 1e-5, n_jobs=n_jobs,
+                             prefer=prefer)
+        ar.fit(X, y, sample_weight=sample_weight)
+        predictions.append(ar.predict(X))
+
+    for p in predictions[1:]:
+        assert np.allclose(predictions[0], p)
+
+
+def test_partition():
+    for discrete_actions in [[-1.3, 0., 2., 7.5],
+                             [[4.5, 3], [4.5655, 3.66], [4.4666, 0.000001]]]:
+        ar = ActionRegressor(Regressor(ExtraTreesRegressor), discrete_actions,
+                             1e-5)
+        np.random.seed(7)
+        idxs = np.random.randint(0, len(discrete_actions), 100)
+        actions = np.array(discrete_actions)[idxs].reshape(100, -1)
+        X = np.column_stack((np.random.randn(100, 2), actions))
+        # rows not matching any action
+        X[:5, -1] += .5
+
+        partition = ar._partition(X)
+        assert ar.cache_hits == 0
+        for i, action in enumerate(ar._actions):
+            mask = np.all(np.abs(X[:, -ar.action_dim:] - action) <= ar.tol,
+                          axis=1)
+            assert np.array_equal(partition[i], np.flatnonzero(mask))
+
+        assert ar._partition(X) is partition
+        assert ar.cache_hits == 1
+        assert ar._partition(X.copy()) is not partition
+        assert ar.cache_hits == 1
+
+
+if __name__ == '__main__':
+    test_parallel_fit()
+    test_partition()
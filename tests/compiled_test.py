@@ -0,0 +1,81 @@
+from __future__ import print_function
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.compiled import compile_model
+from ifqi.models.ensemble import Ensemble
+from ifqi.models.regressor import Regressor
+
+
+def build_fqi(model):
+    np.random.seed(0)
+    discrete_actions = [-1., 0., 1.]
+    state_dim, action_dim = 3, 1
+    n_samples = 500
+
+    states = np.random.randn(n_samples, state_dim)
+    actions = np.random.choice(discrete_actions, (n_samples, action_dim))
+    next_states = np.random.randn(n_samples, state_dim)
+    absorbing = (np.random.rand(n_samples) < .1).astype(float)
+    r = np.random.randn(n_samples)
+    sast = np.column_stack((states, actions, next_states, absorbing))
+
+    if model == 'regressor':
+        estimator = Regressor(ExtraTreesRegressor, n_estimators=5,
+                              random_state=0)
+    elif model == 'action_regressor':
+        estimator = ActionRegressor(
+            Regressor(ExtraTreesRegressor, n_estimators=5, random_state=0),
+            discrete_actions, .5)
+    else:
+        estimator = ActionRegressor(
+            Ensemble(DecisionTreeRegressor, min_samples_leaf=5),
+            discrete_actions, .5)
+
+    fqi = FQI(estimator, state_dim, action_dim, discrete_actions, .9, 3)
+    fqi.fit(sast, r)
+
+    return fqi, next_states, absorbing
+
+
+def test_compiled_predict():
+    for model in ['regressor', 'action_regressor', 'ensemble']:
+        fqi, states, _ = build_fqi(model)
+        compiled = compile_model(fqi._estimator)
+        actions = np.random.choice([-1., 0., 1., 3.], (states.shape[0], 1))
+        sa = np.column_stack((states, actions))
+
+        assert np.allclose(compiled.predict(sa), fqi._estimator.predict(sa))
+
+
+def test_compiled_fqi():
+    for model in ['regressor', 'action_regressor', 'ensemble']:
+        fqi, states, absorbing = build_fqi(model)
+        compiled = fqi.compile()
+        q, a = fqi.maxQA(states, absorbing, evaluation=True)
+        compiled_q, compiled_a = compiled.maxQA(states, absorbing,
+                                                evaluation=True)
+
+        assert np.allclose(q, compiled_q)
+        assert np.array_equal(a, compiled_a)
+        assert np.array_equal(fqi.draw_action(states[:1], False, True),
+                              compiled.draw_action(states[:1], False, True))
+
+
+def test_batches():
+    fqi, states, _ = build_fqi('action_regressor')
+    compiled = compile_model(fqi._estimator)
+    expected = compiled.predict_outputs(states)
+    compiled.batch_size = 7
+
+    assert expected.shape == (states.shape[0], 3)
+    assert np.allclose(compiled.predict_outputs(states), expected)
+
+
+if __name__ == '__main__':
+    test_compiled_predict()
+    test_compiled_fqi()
+    test_batches()
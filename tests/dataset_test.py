@@ -0,0 +1,243 @@
+from __future__ import print_function
+import shutil
+import tempfile
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.evaluation.dataset import DatasetWriter, EpisodeIndex, \
+    TransitionDataset
+from ifqi.evaluation.utils import check_dataset, find_invalid_transitions, \
+    select_episodes, split_data_for_fqi, split_dataset
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.regressor import Regressor
+
+state_dim, action_dim, reward_dim = 2, 1, 1
+discrete_actions = [-1., 1.]
+
+
+def build_dataset(n_episodes=20, horizon=10):
+    """
+    Random walk with episodes of fixed length.
+    """
+    np.random.seed(17)
+    rows = list()
+    for _ in range(n_episodes):
+        state = np.random.randn(state_dim)
+        for t in range(horizon):
+            action = np.random.choice(discrete_actions, action_dim)
+            next_state = state + .1 * action
+            reward = -np.abs(next_state[0])
+            end = 1 if t == horizon - 1 else 0
+            rows.append(np.concatenate((state, action, [reward], next_state,
+                                        [0, end])))
+            state = next_state
+
+    return np.array(rows)
+
+
+def test_columns():
+    data = build_dataset()
+    dataset = TransitionDataset.from_array(data, state_dim, action_dim,
+                                           reward_dim)
+
+    assert len(dataset) == data.shape[0]
+    assert dataset.sa.dtype == np.float32
+    assert dataset.sa.flags['C_CONTIGUOUS']
+    assert np.allclose(dataset.to_array(), data)
+    check_dataset(dataset, state_dim, action_dim, reward_dim)
+
+    for x, y in zip(split_dataset(dataset, state_dim, action_dim, reward_dim,
+                                  50),
+                    split_dataset(data, state_dim, action_dim, reward_dim,
+                                  50)):
+        assert np.allclose(x, y)
+
+    # slices are views of the stored columns
+    subset = dataset[:50]
+    assert len(subset) == 50
+    assert np.shares_memory(subset.sa, dataset.sa)
+
+
+def test_save_load():
+    dataset = TransitionDataset.from_array(build_dataset(), state_dim,
+                                           action_dim, reward_dim)
+    path = tempfile.mkdtemp()
+    try:
+        dataset.save(path)
+        loaded = TransitionDataset.load(path)
+        assert isinstance(loaded.sa, np.memmap)
+        assert np.array_equal(loaded.to_array(), dataset.to_array())
+
+        loaded = TransitionDataset.load(path, mmap_mode=None)
+        assert not isinstance(loaded.sa, np.memmap)
+        assert np.array_equal(loaded.to_array(), dataset.to_array())
+    finally:
+        shutil.rmtree(path)
+
+
+def test_append():
+    data = build_dataset()
+    path = tempfile.mkdtemp()
+    try:
+        with DatasetWriter(path, state_dim, action_dim, reward_dim) as writer:
+            writer.append(data[:100])
+            # readers only see the transitions already appended
+            assert len(TransitionDataset.load(path)) == 100
+        with DatasetWriter(path, state_dim, action_dim, reward_dim) as writer:
+            writer.append(data[100:])
+            assert writer.n_samples == data.shape[0]
+
+        loaded = TransitionDataset.load(path)
+        assert np.allclose(loaded.to_array(), data)
+
+        try:
+            DatasetWriter(path, state_dim + 1, action_dim, reward_dim)
+            assert False
+        except ValueError:
+            pass
+
+        # the memory-mapped dataset is used in place of the flat one
+        sast, r = split_data_for_fqi(loaded, state_dim, action_dim,
+                                     reward_dim)
+        fqi = FQI(Regressor(ExtraTreesRegressor, n_estimators=5,
+                            random_state=0),
+                  state_dim, action_dim, discrete_actions, .9, 2)
+        fqi.fit(sast, r)
+    finally:
+        shutil.rmtree(path)
+
+
+def test_fqi():
+    data = build_dataset()
+    dataset = TransitionDataset.from_array(data, state_dim, action_dim,
+                                           reward_dim)
+
+    # the flat dataset with the same precision of the columns
+    data = dataset.to_array()
+
+    q = list()
+    for sast, r in [split_data_for_fqi(data, state_dim, action_dim,
+                                       reward_dim),
+                    split_data_for_fqi(dataset, state_dim, action_dim,
+                                       reward_dim),
+                    split_data_for_fqi(data, state_dim, action_dim,
+                                       reward_dim, view=True)]:
+        estimator = ActionRegressor(
+            Regressor(ExtraTreesRegressor, n_estimators=5, random_state=0),
+            discrete_actions, 1e-5)
+        fqi = FQI(estimator, state_dim, action_dim, discrete_actions, .9, 3)
+        fqi.fit(sast, r)
+        q.append(fqi.maxQA(data[:, :state_dim], np.zeros(data.shape[0]))[0])
+
+    assert np.allclose(q[0], q[1])
+    assert np.allclose(q[0], q[2])
+
+
+def test_split_views():
+    data = build_dataset()
+    sast, r = split_data_for_fqi(data, state_dim, action_dim, reward_dim,
+                                 50, view=True)
+    ref_sast, ref_r = split_data_for_fqi(data, state_dim, action_dim,
+                                         reward_dim, 50)
+
+    assert len(sast) == 50
+    for c in TransitionDataset.COLUMNS:
+        assert np.shares_memory(getattr(sast, c), data)
+    assert np.shares_memory(r, data)
+    assert np.array_equal(np.column_stack((sast.sa, sast.next_state,
+                                           sast.absorbing)), ref_sast)
+    assert np.array_equal(r, ref_r)
+
+
+def test_episode_index():
+    # episodes of different lengths, the last one is incomplete
+    end = np.array([0, 1, 1, 0, 0, 1, 0])
+    reward = np.arange(7.)
+    index = EpisodeIndex.from_end_flags(end, reward)
+
+    assert len(index) == 4
+    assert np.array_equal(index.starts, [0, 2, 3, 6])
+    assert np.array_equal(index.lengths, [2, 1, 3, 1])
+    assert np.array_equal(index.returns, [1., 2., 12., 6.])
+    assert index.prefix(0) == 0 and index.prefix(3) == 6
+    assert np.array_equal(index.rows([2, 0, 2]), [3, 4, 5, 0, 1, 3, 4, 5])
+
+    episodes = index.sample(10, replace=True, random_state=0)
+    assert episodes.shape == (10,) and np.all(episodes < 4)
+    assert np.array_equal(np.sort(index.sample(4, random_state=0)),
+                          np.arange(4))
+
+    data = build_dataset(n_episodes=20, horizon=10)
+    dataset = TransitionDataset.from_array(data, state_dim, action_dim,
+                                           reward_dim)
+    for d in [data, dataset]:
+        for x, y in zip(split_dataset(d, state_dim, action_dim, reward_dim,
+                                      episodes=3),
+                        split_dataset(d, state_dim, action_dim, reward_dim,
+                                      30)):
+            assert np.allclose(x, y)
+        subset = select_episodes(d, [4, 1])
+        assert len(subset) == 20
+        assert np.allclose(subset[:10], d[40:50])
+
+    # the index is stored with the dataset
+    path = tempfile.mkdtemp()
+    try:
+        with DatasetWriter(path, state_dim, action_dim, reward_dim) as writer:
+            writer.append(data[:45])
+            writer.append(data[45:])
+        loaded = TransitionDataset.load(path)
+        assert loaded._episodes is not None
+        assert np.array_equal(loaded.episodes.ends, np.arange(10, 201, 10))
+        assert np.allclose(loaded.episodes.returns,
+                           dataset.episodes.returns)
+    finally:
+        shutil.rmtree(path)
+
+
+def test_check_dataset():
+    data = build_dataset()
+    # break the continuity inside an episode and at the end of an episode
+    data[14, 0] += 1.
+    data[30, 0] += 1.
+    data[52, -3] = np.nan
+    data[77, 2] = np.inf
+
+    for dataset in [data, TransitionDataset.from_array(
+            data, state_dim, action_dim, reward_dim)]:
+        for chunk_size in [1, 7, 1000]:
+            discontinuous, nonfinite = find_invalid_transitions(
+                dataset, state_dim, action_dim, reward_dim,
+                check_finite=True, chunk_size=chunk_size)
+            assert np.array_equal(discontinuous, [13, 52])
+            assert np.array_equal(nonfinite, [52, 77])
+
+        try:
+            check_dataset(dataset, state_dim, action_dim, reward_dim)
+        except AssertionError as e:
+            assert '2 discontinuous transitions' in str(e)
+        else:
+            assert False
+
+    data = build_dataset()
+    data[77, 2] = np.inf
+    check_dataset(data, state_dim, action_dim, reward_dim)
+    try:
+        check_dataset(data, state_dim, action_dim, reward_dim,
+                      check_finite=True)
+    except AssertionError as e:
+        assert 'rows [77]' in str(e)
+    else:
+        assert False
+
+
+if __name__ == '__main__':
+    test_columns()
+    test_save_load()
+    test_append()
+    test_fqi()
+    test_split_views()
+    test_episode_index()
+    test_check_dataset()
@@ -0,0 +1,293 @@
+from __future__ import print_function
+import os
+import pickle
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.envs import CarOnHill
+from ifqi.envs.vectorenv import SerialVectorEnv, make_vector_env
+from ifqi.evaluation import CachedPolicy, SharedPolicy, evaluation, policies
+from ifqi.models.regressor import Regressor
+
+
+def test_collect_episodes():
+    mdp = CarOnHill()
+
+    np.random.seed(3)
+    dataset = evaluation.collect_episodes(mdp, n_episodes=10)
+    np.random.seed(3)
+    episodes = [evaluation.collect_episode(mdp) for _ in range(10)]
+
+    assert np.array_equal(dataset, np.concatenate(episodes))
+    assert dataset.shape[1] == 2 + 1 + 1 + 2 + 2
+    assert np.sum(dataset[:, -1]) == 10
+    assert dataset[-1, -1] == 1
+    # absorbing transitions end the episode
+    assert np.all(dataset[dataset[:, -2] == 1, -1] == 1)
+
+
+def test_parallel_collect_episodes():
+    kwargs = dict(horizon=100, n_episodes=10, n_jobs=2, seed=5)
+    dataset = evaluation.collect_episodes(CarOnHill, **kwargs)
+
+    # workers are seeded deterministically
+    assert np.array_equal(dataset,
+                          evaluation.collect_episodes(CarOnHill(), **kwargs))
+    assert np.array_equal(dataset,
+                          evaluation.collect_episodes('CarOnHill-v0',
+                                                      **kwargs))
+    # episodes are merged in order
+    assert np.sum(dataset[:, -1]) == 10
+    assert dataset[-1, -1] == 1
+    assert not np.array_equal(dataset,
+                              evaluation.collect_episodes(CarOnHill,
+                                                          horizon=100,
+                                                          n_episodes=10,
+                                                          n_jobs=2, seed=6))
+
+
+class BangBang(object):
+    """
+    Pushes the car in the direction of its velocity.
+    """
+    def draw_action(self, states, absorbing, evaluation=False):
+        states = np.atleast_2d(states)
+        return np.where(states[:, 1:] >= 0, 4., -4.)
+
+
+def test_vectorized_collect_episodes():
+    dataset = evaluation.collect_episodes(CarOnHill, n_episodes=20, seed=1,
+                                          vectorize=True)
+
+    # transitions are sorted by episode
+    ends = np.flatnonzero(dataset[:, -1])
+    assert len(ends) == 20
+    assert ends[-1] == dataset.shape[0] - 1
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    assert np.allclose(dataset[starts, :2], [-.5, 0.])
+    assert np.allclose(dataset[1:, :2][dataset[:-1, -1] == 0],
+                       dataset[:-1, 4:6][dataset[:-1, -1] == 0])
+
+    dataset = evaluation.collect_episodes(CarOnHill(), BangBang(),
+                                          n_episodes=3, vectorize=True)
+    assert np.array_equal(dataset[:, 2], BangBang().draw_action(
+        dataset[:, :2], None).ravel())
+
+
+def test_vectorized_evaluation():
+    mdp = CarOnHill()
+    initial_states = mdp.initial_states[::10]
+    sequential = evaluation.evaluate_policy(mdp, BangBang(),
+                                            initial_states=initial_states)
+    vectorized = evaluation.evaluate_policy(mdp, BangBang(),
+                                            initial_states=initial_states,
+                                            vectorize=True)
+
+    assert np.allclose(sequential, vectorized)
+
+
+class Walk(object):
+    """
+    Deterministic walk on a line without a vectorized implementation.
+    """
+    metadata = {}
+    horizon = 20
+    gamma = .9
+    observation_space = action_space = None
+
+    def reset(self, state=None):
+        self._state = np.zeros(1) if state is None else np.array(state)
+        return self._state
+
+    def step(self, action):
+        self._state = self._state + .1 * np.ravel(action)
+        absorbing = np.abs(self._state[0]) > 1
+        return self._state, float(absorbing), absorbing, {}
+
+
+class Away(object):
+    """
+    Walks away from the origin, counting the queries.
+    """
+    def __init__(self):
+        self.n_calls = 0
+
+    def draw_action(self, states, absorbing, evaluation=False):
+        self.n_calls += 1
+        return np.where(np.atleast_2d(states) >= 0, 1., -1.)
+
+
+def test_serial_vector_env():
+    mdp = Walk()
+    assert isinstance(make_vector_env(mdp, 3), SerialVectorEnv)
+
+    initial_states = np.linspace(-1, 1, 11)[:, np.newaxis]
+    sequential = evaluation.evaluate_policy(mdp, Away(),
+                                            initial_states=initial_states)
+    policy = Away()
+    vectorized = evaluation.evaluate_policy(mdp, policy,
+                                            initial_states=initial_states,
+                                            vectorize=True)
+
+    assert np.allclose(sequential, vectorized)
+    # one query per step of the longest episode
+    assert policy.n_calls == 11
+
+
+def test_parallel_evaluation():
+    mdp = CarOnHill()
+    sequential = evaluation.evaluate_policy(mdp, BangBang(),
+                                            initial_states=mdp.initial_states,
+                                            n_jobs=1)
+    for vectorize in [False, True]:
+        parallel = evaluation.evaluate_policy(
+            CarOnHill, BangBang(), initial_states=mdp.initial_states,
+            n_jobs=2, n_episodes_per_job=50, vectorize=vectorize)
+        assert np.allclose(sequential, parallel)
+
+
+class Table(object):
+    """Policy reading the actions from an array."""
+    def __init__(self):
+        self.actions = np.arange(1000) % 2
+
+    def draw_action(self, states, absorbing, evaluation=False):
+        return self.actions[int(abs(states[0]) * 100) % 1000]
+
+
+def test_shared_policy():
+    shared = SharedPolicy(Table())
+    assert os.path.exists(shared.path)
+    assert shared.nbytes > 0
+
+    # only the path is pickled, the policy is loaded from the file
+    copy = pickle.loads(pickle.dumps(shared))
+    assert len(pickle.dumps(shared)) < len(pickle.dumps(Table()))
+    assert isinstance(copy.policy.actions, np.memmap)
+    assert np.array_equal(copy.policy.actions, Table().actions)
+
+    mdp = CarOnHill()
+    sequential = evaluation.evaluate_policy(mdp, Table(),
+                                            initial_states=mdp.initial_states,
+                                            n_jobs=1)
+    parallel = evaluation.evaluate_policy(CarOnHill, shared,
+                                          initial_states=mdp.initial_states,
+                                          n_jobs=2, n_episodes_per_job=50)
+    assert np.allclose(sequential, parallel)
+
+    shared.close()
+    assert not os.path.exists(shared.path)
+
+    # a process keeps only the most recently loaded policies
+    paths = list()
+    for _ in range(3):
+        shared = SharedPolicy(Table())
+        pickle.loads(pickle.dumps(shared)).policy
+        paths.append(shared.path)
+        shared.close()
+    assert list(policies._loaded_policies) == paths[-2:]
+
+
+def test_shared_fqi():
+    # FQI writes in place the state-action matrix of the single states,
+    # which is loaded read-only by the processes
+    np.random.seed(0)
+    mdp = CarOnHill()
+    states = np.column_stack((np.random.uniform(-1, 1, 300),
+                              np.random.uniform(-3, 3, 300)))
+    actions = np.random.choice([-4., 4.], (300, 1))
+    next_states = states + np.random.randn(300, 2) * .01
+    sast = np.column_stack((states, actions, next_states, np.zeros(300)))
+    fqi = FQI(Regressor(ExtraTreesRegressor, n_estimators=5, random_state=0),
+              2, 1, [-4., 4.], mdp.gamma, 1)
+    fqi.fit(sast, np.random.randn(300))
+    fqi.draw_action(states[0], False, True)
+
+    initial_states = mdp.initial_states[::10]
+    sequential = evaluation.evaluate_policy(mdp, fqi,
+                                            initial_states=initial_states)
+    parallel = evaluation.evaluate_policy(CarOnHill, fqi,
+                                          initial_states=initial_states,
+                                          n_jobs=2, n_episodes_per_job=10)
+    assert np.allclose(sequential, parallel)
+
+
+class Counter(BangBang):
+    """Policy counting the queried states."""
+    def __init__(self):
+        self.n_states = 0
+
+    def draw_action(self, states, absorbing, evaluation=False):
+        self.n_states += np.atleast_2d(states).shape[0]
+        return super(Counter, self).draw_action(states, absorbing,
+                                                evaluation)
+
+
+def test_cached_policy():
+    policy = Counter()
+    cached = CachedPolicy(policy)
+    mdp = CarOnHill()
+    initial_states = mdp.initial_states
+    for metric in ['discounted', 'average']:
+        expected = evaluation.evaluate_policy(mdp, BangBang(), metric=metric,
+                                              initial_states=initial_states,
+                                              n_jobs=1, vectorize=True)
+        values = evaluation.evaluate_policy(mdp, cached, metric=metric,
+                                            initial_states=initial_states,
+                                            n_jobs=1, vectorize=True)
+        assert np.allclose(values, expected)
+    # the second evaluation visits the same states
+    assert policy.n_states == cached.misses == len(cached)
+    assert cached.hits == cached.misses
+
+    # states in the same cell share the action, the oldest is evicted
+    cached = CachedPolicy(Counter(), resolution=.1, max_size=2)
+    states = np.array([[0., .01], [.01, -.01], [1., -1.], [-1., 1.]])
+    actions = cached.draw_action(states, np.zeros(4), True)
+    assert np.array_equal(actions.ravel(), [4., 4., -4., 4.])
+    assert cached.policy.n_states == 3
+    assert cached.misses == 4 and cached.hits == 0
+    assert cached.evictions == 1 and len(cached) == 2
+    cached.draw_action(states[2], False, True)
+    assert cached.hits == 1
+
+    # outside evaluation the policy is always queried
+    cached.draw_action(states, np.zeros(4))
+    assert cached.policy.n_states == 7
+
+    # single states and batches share the entries and get copies of them
+    cached = CachedPolicy(BangBang())
+    single = cached.draw_action(states[0], False, True)
+    batch = cached.draw_action(states, np.zeros(4), True)
+    assert single.shape == (1, 1) and batch.shape == (4, 1)
+    single[:] = 0.
+    batch[:] = 0.
+    assert np.array_equal(cached.draw_action(states[1], False, True), [[-4.]])
+    assert np.array_equal(cached.draw_action(states, np.zeros(4), True),
+                          [[4.], [-4.], [-4.], [4.]])
+    assert cached.hits == 6 and cached.misses == 4
+
+
+def test_transition_buffer():
+    buffer = evaluation._TransitionBuffer(capacity=1)
+    rows = np.random.randn(100, 2 + 1 + 1 + 2 + 2)
+    for row in rows:
+        buffer.append(row[:2], row[2], row[3], row[4:6], row[6], row[7])
+
+    assert buffer.n_samples == 100
+    assert np.array_equal(buffer.get_data(), rows)
+
+
+if __name__ == '__main__':
+    test_collect_episodes()
+    test_parallel_collect_episodes()
+    test_vectorized_collect_episodes()
+    test_vectorized_evaluation()
+    test_serial_vector_env()
+    test_parallel_evaluation()
+    test_shared_policy()
+    test_shared_fqi()
+    test_cached_policy()
+    test_transition_buffer()
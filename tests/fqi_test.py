@@ -0,0 +1,71 @@
+from __future__ import print_function
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.regressor import Regressor
+
+
+def build_dataset(n_samples=200):
+    np.random.seed(11)
+    states = np.random.uniform(-1, 1, (n_samples, 2))
+    actions = np.random.choice([-1., 1.], (n_samples, 1))
+    next_states = np.clip(states + .1 * actions, -1, 1)
+    absorbing = np.zeros(n_samples)
+    r = -np.abs(next_states[:, 0])
+    sast = np.column_stack((states, actions, next_states, absorbing))
+
+    return sast, r
+
+
+class CountingSGD(SGDRegressor):
+    """
+    SGD regressor recording whether each fit was warm-started.
+    """
+    def fit(self, X, y, **kwargs):
+        if not hasattr(self, 'warm_fits'):
+            self.warm_fits = list()
+        self.warm_fits.append(self.warm_start and hasattr(self, 'coef_'))
+        return super(CountingSGD, self).fit(X, y, **kwargs)
+
+
+def test_warm_start():
+    sast, r = build_dataset()
+    for warm_start in [False, True]:
+        estimator = ActionRegressor(
+            Regressor(CountingSGD, max_iter=5, tol=None, random_state=0),
+            [-1., 1.], 1e-5)
+        fqi = FQI(estimator, 2, 1, [-1., 1.], .9, 4, warm_start=warm_start)
+        fqi.fit(sast, r)
+
+        for model in estimator._models:
+            warm_fits = model._regressor.warm_fits
+            assert len(warm_fits) == 4
+            assert not warm_fits[0]
+            assert warm_fits[1:] == [warm_start] * 3
+
+
+def test_convergence():
+    sast, r = build_dataset()
+    estimator = Regressor(SGDRegressor, max_iter=50, random_state=0)
+    fqi = FQI(estimator, 2, 1, [-1., 1.], .5, 100)
+    fqi.fit(sast, r)
+
+    assert fqi._iteration == 100
+    assert len(fqi.deltas) == 99
+    assert not fqi.converged
+
+    epsilon = 1e-3
+    fqi = FQI(estimator, 2, 1, [-1., 1.], .5, 100, epsilon=epsilon)
+    fqi.fit(sast, r)
+
+    assert fqi.converged
+    assert fqi._iteration < 100
+    assert fqi.deltas[-1] < epsilon
+    assert all(delta >= epsilon for delta in fqi.deltas[:-1])
+
+
+if __name__ == '__main__':
+    test_warm_start()
+    test_convergence()
@@ -0,0 +1,100 @@
+from __future__ import print_function
+import numpy as np
+
+from ifqi.envs import Acrobot, CarOnHill
+from ifqi.envs.integrators import batch_odeint, integrate, rk4
+
+
+def oscillator(y, t):
+    return y[1], -y[0]
+
+
+def test_rk4():
+    np.random.seed(0)
+    y0 = np.random.randn(10, 2)
+    y = rk4(oscillator, y0, 1., 20)
+    expected = np.column_stack((y0[:, 0] * np.cos(1.) + y0[:, 1] * np.sin(1.),
+                                y0[:, 1] * np.cos(1.) - y0[:, 0] * np.sin(1.)))
+
+    assert np.allclose(y, expected, atol=1e-6)
+    assert np.allclose(rk4(oscillator, y0[:1], 1., 20), y[:1])
+    assert np.allclose(rk4(oscillator, y0, 1., 1, tol=1e-9), expected,
+                       atol=1e-8)
+    assert np.allclose(batch_odeint(oscillator, y0, [0, 1.]), expected,
+                       atol=1e-6)
+
+
+def compare(env, sa, tol, rk4_rows=slice(None)):
+    odeint_env = env.__class__()
+    rk4_env = env.__class__(integrator='rk4', n_substeps=10)
+    reference = integrate(env._dpds, sa, env._dt, rtol=1e-11, atol=1e-11,
+                          mxstep=100000)
+
+    for e, rows in [(odeint_env, slice(None)), (rk4_env, rk4_rows)]:
+        assert np.allclose(e._integrate(sa)[rows], reference[rows],
+                           rtol=tol, atol=tol)
+        # a single system is not integrated as a batch
+        single = np.vstack([e._integrate(x[np.newaxis]) for x in sa])
+        assert np.allclose(single[rows], reference[rows], rtol=tol, atol=tol)
+
+
+def test_car_on_hill():
+    np.random.seed(0)
+    sa = np.column_stack((np.random.uniform(-1, 1, 100),
+                          np.random.uniform(-3, 3, 100),
+                          np.random.choice([-4., 4.], 100)))
+    reference = integrate(CarOnHill()._dpds, sa, .1, rtol=1e-11, atol=1e-11)
+    # the acceleration is not continuous in 0, hence the fixed steps of rk4
+    # are only accurate on the transitions that do not cross it
+    same_branch = (sa[:, 0] >= 0) == (reference[:, 0] >= 0)
+    assert 0 < np.sum(sa[same_branch, 0] >= 0) < np.sum(same_branch)
+    compare(CarOnHill(), sa, 1e-6, same_branch)
+
+
+def test_acrobot():
+    np.random.seed(0)
+    sa = np.column_stack((np.random.uniform(-np.pi, np.pi, (100, 2)),
+                          np.random.uniform(-2, 2, (100, 2)),
+                          np.random.choice([-5., 5.], 100)))
+    compare(Acrobot(), sa, 2e-4)
+
+
+def test_acrobot_rollout():
+    # under random torques the velocities of Acrobot reach hundreds of
+    # radians per second, where fixed steps diverge
+    env = Acrobot(integrator='rk4')
+    env.seed(0)
+    np.random.seed(0)
+    env.reset()
+    for t in range(100):
+        state = env.step(np.random.choice([-5., 5.]))[0]
+        assert np.all(np.isfinite(state))
+
+    # the divergence is reported
+    try:
+        with np.errstate(over='ignore', invalid='ignore'):
+            integrate(lambda y, t: (y[0] ** 2,), np.ones((2, 1)), 2., 'rk4')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_episodes():
+    states = list()
+    for integrator in ['odeint', 'rk4']:
+        env = CarOnHill(integrator=integrator).vectorize(10)
+        env.reset(np.column_stack((np.linspace(-.9, -.3, 10),
+                                   np.zeros(10))))
+        for t in range(5):
+            state = env.step(4. * np.ones(10))[0]
+        states.append(state)
+
+    assert np.allclose(states[0], states[1], atol=1e-4)
+
+
+if __name__ == '__main__':
+    test_rk4()
+    test_car_on_hill()
+    test_acrobot()
+    test_acrobot_rollout()
+    test_episodes()
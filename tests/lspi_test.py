@@ -0,0 +1,88 @@
+from __future__ import print_function
+import numpy as np
+import scipy.sparse as sp
+
+from ifqi.algorithms.lspi import LSTDQ, _solve
+from ifqi.models.linear import Linear
+from ifqi.models.regressor import Regressor
+
+state_dim, action_dim = 2, 1
+discrete_actions = [-1., 1.]
+
+
+class SparsePoly(object):
+    """Polynomial features returned as a sparse matrix."""
+    def __init__(self, features):
+        self.features = features
+
+    def fit_transform(self, X):
+        return sp.csr_matrix(self.features.fit_transform(X))
+
+    def transform(self, X):
+        return sp.csr_matrix(self.features.transform(X))
+
+
+def build_dataset(n_samples=200):
+    np.random.seed(3)
+    states = np.random.randn(n_samples, state_dim)
+    actions = np.random.choice(discrete_actions, (n_samples, action_dim))
+    next_states = states + .1 * actions
+    absorbing = (np.random.rand(n_samples) < .1).astype(float)
+    r = -np.abs(next_states[:, 0])
+
+    return np.column_stack((states, actions, next_states, absorbing)), r
+
+
+def reference_weights(lstdq, sast, r):
+    """
+    LSTDQ step computed with the whole feature matrices, as done by the
+    original implementation.
+    """
+    sa = sast[:, :state_dim + action_dim]
+    snext = sast[:, state_dim + action_dim:-1]
+    features = lstdq._estimator.features
+    phi_hat = np.asarray(sp.csr_matrix(features.transform(sa)).todense()).T
+    best_actions = lstdq.draw_action(snext, sast[:, -1]).reshape(-1, 1)
+    pi_phi_hat = np.asarray(sp.csr_matrix(features.transform(
+        np.concatenate((snext, best_actions), axis=1))).todense()).T
+
+    A = np.dot(phi_hat, (phi_hat - lstdq.gamma * pi_phi_hat).T)
+    b = np.dot(phi_hat, r.reshape(-1, 1))
+
+    return np.dot(np.linalg.pinv(A), b)
+
+
+def test_lstdq():
+    sast, r = build_dataset()
+    for sparse in [False, True]:
+        for chunk_size, cache_features in [(None, False), (37, False),
+                                           (None, True), (37, True)]:
+            regressor = Regressor(Linear, features=dict(name='poly',
+                                                        params=dict(degree=3)))
+            if sparse:
+                regressor.features = SparsePoly(regressor.features)
+            lstdq = LSTDQ(regressor, state_dim, action_dim, discrete_actions,
+                          .9, chunk_size=chunk_size,
+                          cache_features=cache_features)
+            lstdq.fit(sast, r)
+
+            for _ in range(3):
+                expected = reference_weights(lstdq, sast, r)
+                lstdq.fit()
+                assert np.allclose(regressor.get_weights(), expected.T)
+
+
+def test_singular_solve():
+    np.random.seed(0)
+    A = np.random.randn(5, 5)
+    b = np.random.randn(5, 1)
+    assert np.allclose(_solve(A, b), np.linalg.solve(A, b))
+
+    A[:, 4] = A[:, 3]
+    assert np.allclose(_solve(A, b), np.dot(np.linalg.pinv(A), b))
+    assert np.allclose(_solve(np.zeros((3, 3)), np.ones((3, 1))), 0.)
+
+
+if __name__ == '__main__':
+    test_lstdq()
+    test_singular_solve()
@@ -0,0 +1,156 @@
+from __future__ import print_function
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+from ifqi.algorithms.fqi import FQI
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.ensemble import Ensemble
+from ifqi.models.regressor import Regressor
+
+
+def build_fqi(use_action_regressor, **kwargs):
+    np.random.seed(123)
+    discrete_actions = [-1., 0., 1.]
+    state_dim, action_dim = 3, 1
+    n_samples = 500
+
+    states = np.random.randn(n_samples, state_dim)
+    actions = np.random.choice(discrete_actions, (n_samples, action_dim))
+    next_states = np.random.randn(n_samples, state_dim)
+    absorbing = (np.random.rand(n_samples) < .1).astype(float)
+    r = np.random.randn(n_samples)
+    sast = np.column_stack((states, actions, next_states, absorbing))
+
+    estimator = Regressor(ExtraTreesRegressor, n_estimators=5,
+                          random_state=0)
+    if use_action_regressor:
+        estimator = ActionRegressor(estimator, discrete_actions, 1e-5)
+
+    fqi = FQI(estimator, state_dim, action_dim, discrete_actions, .9, 3,
+              **kwargs)
+    fqi.fit(sast, r)
+
+    return fqi, next_states, absorbing
+
+
+def reference_maxQA(fqi, states, absorbing):
+    """
+    Evaluate each action separately, as done by the original implementation.
+    """
+    Q = np.zeros((states.shape[0], fqi._actions.shape[0]))
+    for i, action in enumerate(fqi._actions):
+        actions = np.tile(action, (states.shape[0], 1))
+        Q[:, i] = fqi._estimator.predict(np.column_stack((states, actions)))
+    Q *= (1 - absorbing).reshape(-1, 1)
+    amax = np.argmax(Q, axis=1)
+
+    return Q[np.arange(Q.shape[0]), amax], fqi._actions[amax]
+
+
+def test_maxQA():
+    for use_action_regressor in [False, True]:
+        fqi, states, absorbing = build_fqi(use_action_regressor)
+        q, a = fqi.maxQA(states, absorbing)
+        ref_q, ref_a = reference_maxQA(fqi, states, absorbing)
+
+        assert q.shape == (states.shape[0],)
+        assert a.shape == (states.shape[0], 1)
+        assert np.allclose(q, ref_q)
+        assert np.allclose(a, ref_a)
+
+
+def test_chunked_maxQA():
+    fqi, states, absorbing = build_fqi(True)
+    q, a = fqi.maxQA(states, absorbing)
+
+    for chunk_size, chunk_bytes in [(1, None), (7, None), (None, 1000),
+                                    (50, 64)]:
+        fqi.chunk_size = chunk_size
+        fqi.chunk_bytes = chunk_bytes
+        chunk_q, chunk_a = fqi.maxQA(states, absorbing)
+
+        assert np.allclose(q, chunk_q)
+        assert np.allclose(a, chunk_a)
+
+
+def test_parallel_maxQA():
+    fqi, states, absorbing = build_fqi(True)
+    q, a = fqi.maxQA(states, absorbing)
+
+    for prefer in ['threads', 'processes']:
+        fqi.n_jobs = 2
+        fqi.prefer = prefer
+        fqi._estimator.n_jobs = 2
+        fqi._estimator.prefer = prefer
+        parallel_q, parallel_a = fqi.maxQA(states, absorbing)
+
+        assert np.allclose(q, parallel_q)
+        assert np.allclose(a, parallel_a)
+
+
+def test_ensemble_q_cache():
+    np.random.seed(5)
+    discrete_actions = [-1., 1.]
+    n_samples = 200
+    states = np.random.randn(n_samples, 2)
+    actions = np.random.choice(discrete_actions, (n_samples, 1))
+    next_states = np.random.randn(n_samples, 2)
+    absorbing = (np.random.rand(n_samples) < .1).astype(float)
+    r = np.random.randn(n_samples)
+    sast = np.column_stack((states, actions, next_states, absorbing))
+
+    for use_action_regressor in [False, True]:
+        estimator = Ensemble(ExtraTreesRegressor, n_estimators=5,
+                             random_state=0)
+        if use_action_regressor:
+            estimator = ActionRegressor(estimator, discrete_actions, 1e-5)
+        fqi = FQI(estimator, 2, 1, discrete_actions, .9, 4, chunk_size=64)
+        fqi.fit(sast, r)
+
+        # the cache contains all the stages but the last one
+        assert fqi._q_cache_stages == estimator.n_stages - 1
+        q, a = fqi.maxQA(fqi._snext, fqi._absorbing)
+        assert fqi._q_cache_stages == estimator.n_stages
+        ref_q, ref_a = fqi.maxQA(next_states, absorbing, evaluation=True)
+        assert np.allclose(q, ref_q)
+        assert np.allclose(a, ref_a)
+
+        # a new dataset invalidates the cache
+        new_sast = sast.copy()
+        new_sast[:, 3:5] = np.random.randn(n_samples, 2)
+        fqi.partial_fit(new_sast, r)
+        q, a = fqi.maxQA(fqi._snext, fqi._absorbing)
+        ref_q, ref_a = fqi.maxQA(new_sast[:, 3:5], absorbing, evaluation=True)
+        assert np.allclose(q, ref_q)
+        assert np.allclose(a, ref_a)
+
+
+def test_single_state_draw_action():
+    for use_action_regressor in [False, True]:
+        fqi, states, absorbing = build_fqi(use_action_regressor,
+                                           tie_breaking='first')
+        _, a = fqi.maxQA(states, absorbing)
+
+        for state, absorbing_state, action in zip(states, absorbing, a):
+            single = fqi.draw_action(state, absorbing_state, True)
+            assert single.shape == (1, 1)
+            assert np.allclose(single[0], action)
+
+        # the state-action matrix is reused and the action is a read-only
+        # view of the discrete actions
+        sa = fqi._single_sa
+        single = fqi.draw_action(states[0], False)
+        assert fqi._single_sa is sa
+        assert single.base is fqi._single_actions
+        assert not single.flags.writeable
+
+        # all the actions have zero value in absorbing states
+        assert np.allclose(fqi.draw_action(states[0], True), fqi._actions[0])
+
+
+if __name__ == '__main__':
+    test_maxQA()
+    test_chunked_maxQA()
+    test_parallel_maxQA()
+    test_ensemble_q_cache()
+    test_single_state_draw_action()
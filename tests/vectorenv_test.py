@@ -0,0 +1,86 @@
+from __future__ import print_function
+import numpy as np
+
+from ifqi.envs import Acrobot, Bicycle, CarOnHill, InvPendulum, LQG1D, \
+    SwingPendulum
+
+
+def compare(env, initial_states, actions, atol, rtol=1e-5):
+    n_envs = initial_states.shape[0]
+    vector_env = env.vectorize(n_envs)
+    vector_env.reset(initial_states)
+    steps = [vector_env.step(a) for a in actions]
+
+    for i in range(n_envs):
+        env.reset(initial_states[i])
+        for t in range(actions.shape[0]):
+            state, reward, absorbing, _ = env.step(actions[t, i])
+            vector_state, vector_reward, vector_absorbing, _ = steps[t]
+            assert np.allclose(state, vector_state[i], rtol=rtol, atol=atol)
+            assert np.isclose(reward, vector_reward[i], rtol=rtol, atol=atol)
+            assert absorbing == vector_absorbing[i]
+            if absorbing:
+                # absorbing episodes are not simulated anymore
+                for later in steps[t + 1:]:
+                    assert np.array_equal(later[0][i], vector_state[i])
+                    assert later[1][i] == 0
+                break
+
+
+def test_car_on_hill():
+    np.random.seed(0)
+    env = CarOnHill()
+    compare(env, env.initial_states[::7], np.random.choice(
+        [-4., 4.], (30, env.initial_states[::7].shape[0], 1)), 1e-5)
+
+
+def test_inverted_pendulum():
+    np.random.seed(0)
+    env = InvPendulum()
+    env._noise = 0.
+    compare(env, np.random.uniform(-.3, .3, (20, 2)),
+            np.random.choice([-50., 0., 50.], (50, 20, 1)), 1e-10)
+
+
+def test_acrobot():
+    np.random.seed(0)
+    env = Acrobot()
+    initial_states = np.zeros((10, 4))
+    initial_states[:, 0] = np.linspace(-2, 2, 10)
+    # the stacked systems are integrated with the steps of the fastest
+    # one, hence the states drift from the ones of single systems
+    compare(env, initial_states,
+            np.random.choice([-5., 5.], (20, 10, 1)), 1e-2, 5e-3)
+
+
+def test_bicycle():
+    np.random.seed(0)
+    env = Bicycle()
+    # the initial states are chosen by the environment
+    compare(env, np.zeros((10, 5)),
+            np.random.randint(9, size=(50, 10, 1)).astype(float), 1e-10)
+
+
+def test_lqg1d():
+    np.random.seed(0)
+    env = LQG1D()
+    env.sigma_noise = 0.
+    compare(env, np.random.uniform(-10, 10, (10, 1)),
+            np.random.uniform(-8, 8, (30, 10, 1)), 1e-10)
+
+
+def test_swing_pendulum():
+    np.random.seed(0)
+    env = SwingPendulum()
+    compare(env, np.column_stack((np.random.uniform(-np.pi, np.pi, 10),
+                                  np.zeros(10))),
+            np.random.choice([-5., 0., 5.], (50, 10, 1)), 1e-10)
+
+
+if __name__ == '__main__':
+    test_car_on_hill()
+    test_inverted_pendulum()
+    test_acrobot()
+    test_bicycle()
+    test_lqg1d()
+    test_swing_pendulum()